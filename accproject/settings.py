@@ -1,5 +1,7 @@
 
+import os
 from pathlib import Path
+from .database import REPLICA_ALIAS, database_config, env_bool
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,6 +38,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,12 +68,20 @@ WSGI_APPLICATION = 'accproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Configured from DATABASE_URL and friends, see accproject/database.py
+
+DATABASES = database_config(BASE_DIR)
+
+# With DATABASE_REPLICA_URL set, reads of these viewset actions go to the replica
+DATABASE_REPLICA_ALIAS = REPLICA_ALIAS
+
+REPLICA_READ_ACTIONS = ['list', 'retrieve', 'analytics']
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter'] if REPLICA_ALIAS in DATABASES else []
+
+# Seconds the replica may trail the primary; cached reads of data written more
+# recently than this are served from the primary (see api.response_cache)
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5)) if REPLICA_ALIAS in DATABASES else 0
 
 
 # Password validation
@@ -90,27 +102,63 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Logging
+# Levels, sampling and format come from the environment. API_LOG_SAMPLE_RATE keeps
+# that fraction of api debug/info records; warnings and errors are always kept.
+# API_LOG_FORMAT=json writes one JSON object per line, with any ``extra`` fields.
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING')
+
+DJANGO_LOG_LEVEL = os.environ.get('DJANGO_LOG_LEVEL', 'INFO')
+
+API_LOG_LEVEL = os.environ.get('API_LOG_LEVEL', 'INFO')
+
+API_LOG_SAMPLE_RATE = float(os.environ.get('API_LOG_SAMPLE_RATE', '1.0'))
+
+API_LOG_FORMAT = os.environ.get('API_LOG_FORMAT', 'plain')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sampled': {
+            '()': 'api.log.SamplingFilter',
+            'rate': API_LOG_SAMPLE_RATE,
+        },
+    },
+    'formatters': {
+        'plain': {
+            'format': '{levelname} {name} {message}',
+            'style': '{',
+        },
+        'json': {
+            '()': 'api.log.StructuredFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
+            'formatter': API_LOG_FORMAT,
+        },
+        'api_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': API_LOG_FORMAT,
+            'filters': ['sampled'],
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
     },
     'loggers': {
         'django': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': DJANGO_LOG_LEVEL,
             'propagate': False,
         },
         'api': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
+            'handlers': ['api_console'],
+            'level': API_LOG_LEVEL,
             'propagate': False,
         },
     },
@@ -136,3 +184,129 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Account permissions
+# Per-user permission maps are cached in-process for this many seconds (0 disables)
+
+ACCOUNT_PERMISSION_CACHE_TTL = 30
+
+ACCOUNT_PERMISSION_CACHE_SIZE = 10000
+
+# Cache holding the per-user version stamps; point it at a shared backend so a
+# permission change reaches every process immediately instead of after the TTL
+ACCOUNT_PERMISSION_CACHE_ALIAS = 'default'
+
+# Larger accessible-account sets are filtered with a subquery instead of an IN list
+ACCOUNT_FILTER_MAX_IDS = 10000
+
+
+# SQLite performance mode (DATABASE_SQLITE_TUNING, see accproject/database.py)
+# also sends transaction creates through a single group-committing writer thread
+
+SQLITE_WRITE_QUEUE = env_bool(os.environ, 'DATABASE_SQLITE_TUNING', False)
+
+SQLITE_WRITE_QUEUE_BATCH_SIZE = 100
+
+# Seconds the writer waits for more writes before committing a batch
+SQLITE_WRITE_QUEUE_MAX_WAIT = 0.002
+
+SQLITE_WRITE_QUEUE_TIMEOUT = 30
+
+
+# Bulk transaction uploads
+
+TRANSACTION_BULK_BATCH_SIZE = 1000
+
+TRANSACTION_BULK_MAX_ROWS = 100000
+
+
+# Bulk permission changes (POST /api/permissions/bulk/)
+
+PERMISSION_BULK_BATCH_SIZE = 1000
+
+PERMISSION_BULK_MAX_ROWS = 100000
+
+
+# Transaction archive
+# archive_transactions moves transactions older than this many days out of the hot table
+
+TRANSACTION_ARCHIVE_AFTER_DAYS = int(os.environ.get('TRANSACTION_ARCHIVE_AFTER_DAYS', 365))
+
+TRANSACTION_ARCHIVE_BATCH_SIZE = 5000
+
+
+# Account statistics (api.stats)
+# Results for this many (account, ledger sequence) pairs are kept in memory per process
+
+ACCOUNT_STATS_CACHE_SIZE = 32
+
+
+# Background jobs (manage.py run_worker)
+# Result files such as reports are written under JOB_RESULT_DIR; running jobs older
+# than JOB_TIMEOUT seconds are assumed orphaned by a dead worker and run again
+
+JOB_RESULT_DIR = os.environ.get('JOB_RESULT_DIR', str(BASE_DIR / 'job_results'))
+
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', 2))
+
+JOB_POLL_INTERVAL = 1.0
+
+JOB_TIMEOUT = 60 * 60
+
+
+# Idempotency-Key handling for transaction POSTs
+# Responses are replayed for this many seconds; the cache alias fronts the IdempotencyKey table
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+
+
+# Caches
+# Version counters and permission stamps live in 'default'; use a shared backend
+# (e.g. Redis) there when running several processes. Read responses are cached in
+# 'responses': in memory, or on disk under RESPONSE_CACHE_DIR when it is set.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 1000, 'CULL_FREQUENCY': 4},
+    },
+}
+
+if os.environ.get('RESPONSE_CACHE_DIR'):
+    CACHES['responses'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['RESPONSE_CACHE_DIR'],
+    })
+
+
+# Response caching for the account and transaction reads
+# Strong ETags come from per-account version counters; bodies are kept this many seconds
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+RESPONSE_VERSION_CACHE_ALIAS = 'default'
+
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Transaction lists over more accounts than this are versioned by one counter that
+# any account's change bumps, instead of reading a counter per account
+RESPONSE_CACHE_MAX_ACCOUNT_KEYS = 100
+
+
+# Request metrics
+# Exposed in Prometheus format at /api/metrics/ to staff users and these addresses.
+# None by default: behind a local reverse proxy every client arrives from 127.0.0.1
+
+METRICS_ALLOWED_IPS = []
+
+# Lets staff users profile a request by sending an X-Profile header
+
+API_PROFILING_ENABLED = DEBUG
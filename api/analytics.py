@@ -0,0 +1,89 @@
+from django.db.models import Count, DateField, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from .balances import cents, day_of
+from .encoders import format_decimal
+from .models import DailyBalance
+
+PERIODS = ('day', 'week', 'month')
+METRICS = ('total', 'count', 'min', 'max')
+# What the daily rollup can answer; min and max need the raw rows
+ROLLUP_METRICS = ('total', 'count')
+
+
+def truncate(field, period):
+    """Expression grouping ``field`` by calendar day, week (starting Monday) or month, as a date."""
+    if period == 'day':
+        return TruncDate(field)
+    trunc = TruncWeek if period == 'week' else TruncMonth
+    return trunc(field, output_field=DateField())
+
+
+def aggregate_transactions(transactions, period, metrics=METRICS, by_user=False, archived=None):
+    """
+    Group ``transactions`` by period (and user) in one GROUP BY query.
+
+    ``archived`` transactions, when given, are grouped in a second query and
+    their groups combined with the first's.
+    """
+    aggregates = {
+        'total': Sum('amount'),
+        'count': Count('id'),
+        'min': Min('amount'),
+        'max': Max('amount'),
+    }
+    group = ['period', 'user_id'] if by_user else ['period']
+    groups = {}
+    for queryset in [transactions] if archived is None else [transactions, archived]:
+        rows = (
+            queryset.annotate(period=truncate('created_at', period))
+            .values(*group)
+            .annotate(**{metric: aggregates[metric] for metric in metrics})
+            .order_by(*group)
+        )
+        for row in rows:
+            key = tuple(row[name] for name in group)
+            groups[key] = combine(groups[key], row, metrics) if key in groups else row
+    return [format_row(groups[key], metrics, by_user) for key in sorted(groups)]
+
+
+def combine(row, other, metrics):
+    """Merge the aggregates of one group computed over two tables."""
+    combined = dict(row)
+    for metric in metrics:
+        if metric == 'total':
+            combined[metric] = cents(row[metric]) + cents(other[metric])
+        elif metric == 'count':
+            combined[metric] = row[metric] + other[metric]
+        else:
+            combined[metric] = (min if metric == 'min' else max)(row[metric], other[metric])
+    return combined
+
+
+def aggregate_rollup(account_id, period, metrics=ROLLUP_METRICS, date_range=None):
+    """Like aggregate_transactions for a whole account, summed from its DailyBalance rows."""
+    aggregates = {'total': Sum('total'), 'count': Sum('count')}
+    # Days whose transactions were all deleted keep a zeroed row, which the raw query would not see
+    rollups = DailyBalance.objects.filter(account_id=account_id, count__gt=0)
+    if date_range is not None:
+        rollups = rollups.filter(date__range=[day_of(date_range[0]), day_of(date_range[1])])
+    rows = (
+        rollups.annotate(period=F('date') if period == 'day' else truncate('date', period))
+        .values('period')
+        .annotate(**{metric: aggregates[metric] for metric in metrics})
+        .order_by('period')
+    )
+    return [format_row(row, metrics) for row in rows]
+
+
+def format_row(row, metrics, by_user=False):
+    result = {'period': row['period'].isoformat()}
+    if by_user:
+        result['user'] = row['user_id']
+    for metric in metrics:
+        value = row[metric]
+        if metric == 'total':
+            value = format_decimal(cents(value))
+        elif metric != 'count':
+            value = format_decimal(value)
+        result[metric] = value
+    return result
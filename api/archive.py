@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import ArchivedTransaction, Transaction
+
+ARCHIVED_FIELDS = ('id', 'account_id', 'user_id', 'amount', 'created_at', 'version')
+
+# True while archive_transactions() deletes the rows it has copied; the delete signal skips the ledger then
+archiving = ContextVar('archiving', default=False)
+
+
+@contextmanager
+def moving_to_archive():
+    token = archiving.set(True)
+    try:
+        yield
+    finally:
+        archiving.reset(token)
+
+
+def archive_horizon(now=None):
+    """Transactions created before this are due for the archive."""
+    days = getattr(settings, 'TRANSACTION_ARCHIVE_AFTER_DAYS', 365)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_transactions(before, batch_size=None, account_ids=None):
+    """
+    Move transactions created before ``before`` into ArchivedTransaction.
+
+    Each batch is copied and deleted in its own transaction. The rows' amounts
+    stay in the account balances and daily rollups, so the delete skips the
+    ledger and balance signals. Returns the ids of the accounts whose rows moved and the
+    number of rows moved.
+    """
+    batch_size = batch_size or getattr(settings, 'TRANSACTION_ARCHIVE_BATCH_SIZE', 5000)
+    due = Transaction.objects.filter(created_at__lt=before)
+    if account_ids:
+        due = due.filter(account_id__in=account_ids)
+
+    accounts = set()
+    moved = 0
+    while True:
+        with transaction.atomic(), moving_to_archive():
+            rows = list(due.order_by('id').values_list(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                break
+            ArchivedTransaction.objects.bulk_create(
+                [ArchivedTransaction(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows])
+            Transaction.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        accounts.update(row[1] for row in rows)
+        moved += len(rows)
+    return accounts, moved
+
+
+def archived_until(account_id):
+    """Creation time of the account's newest archived transaction, or None."""
+    return ArchivedTransaction.objects.filter(account_id=account_id).aggregate(Max('created_at'))['created_at__max']
+
+
+def needs_archive(account_id, start=None):
+    """True when reading the account's transactions from ``start`` on has to include the archive."""
+    until = archived_until(account_id)
+    return until is not None and (start is None or start <= until)
@@ -0,0 +1,125 @@
+"""
+Async-native read views for ASGI deployments.
+
+These mirror the DRF read endpoints but run on the event loop with Django's
+async ORM, so a worker can hold many slow clients open without tying up a
+thread per request. They authenticate with the session (``request.auser()``)
+and apply the same account permissions as AccountPermission.
+"""
+from datetime import datetime
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound
+from .balances import range_total
+from .encoders import format_datetime, format_decimal
+from .models import InvestmentAccount, Transaction, UserAccountPermission
+from .pagination import KeysetPagination
+from .permission_cache import LIST_PERMISSIONS
+
+
+
+def error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+async def get_user(request):
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def can_view(user, account_id):
+    if user.is_superuser:
+        return True
+    permission = await UserAccountPermission.objects.filter(
+        user=user, account_id=account_id).values_list('permission', flat=True).afirst()
+    return permission in LIST_PERMISSIONS
+
+
+def listable_account_ids(user):
+    # A subquery rather than the process cache, whose loads would need a thread hop
+    return UserAccountPermission.objects.filter(user=user, permission__in=LIST_PERMISSIONS).values('account_id')
+
+
+def account_data(row):
+    return {'id': row['id'], 'name': row['name'], 'created_at': format_datetime(row['created_at'])}
+
+
+@require_GET
+async def account_list(request):
+    user = await get_user(request)
+    if user is None:
+        return error('Authentication credentials were not provided.', 403)
+
+    accounts = InvestmentAccount.objects.all()
+    if not user.is_superuser:
+        accounts = accounts.filter(pk__in=listable_account_ids(user))
+    # values() rather than values_list(): only the former iterates lazily under aiterator()
+    rows = accounts.values('id', 'name', 'created_at')
+    return JsonResponse([account_data(row) async for row in rows.aiterator()], safe=False)
+
+
+@require_GET
+async def account_detail(request, pk):
+    user = await get_user(request)
+    if user is None:
+        return error('Authentication credentials were not provided.', 403)
+    if not await can_view(user, pk):
+        return error('You do not have permission to perform this action.', 403)
+
+    row = await InvestmentAccount.objects.filter(pk=pk).values('id', 'name', 'created_at').afirst()
+    if row is None:
+        return error('No InvestmentAccount matches the given query.', 404)
+    return JsonResponse(account_data(row))
+
+
+@require_GET
+async def account_balance(request, pk):
+    """Balance of an account, optionally limited to a start_date/end_date range."""
+    user = await get_user(request)
+    if user is None:
+        return error('Authentication credentials were not provided.', 403)
+    if not await can_view(user, pk):
+        return error('You do not have permission to perform this action.', 403)
+
+    start_date = parse_date(request.GET.get('start_date') or '')
+    end_date = parse_date(request.GET.get('end_date') or '')
+    if start_date and end_date:
+        start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+        end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
+        # The rollup and archive lookups of range_total() are sync only
+        balance = await sync_to_async(range_total)(pk, start_datetime, end_datetime)
+    else:
+        balance = await InvestmentAccount.objects.filter(pk=pk).values_list('balance', flat=True).afirst()
+    return JsonResponse({'account': pk, 'total_balance': format_decimal(balance or Decimal('0.00'))})
+
+
+@require_GET
+async def transaction_list(request):
+    user = await get_user(request)
+    if user is None:
+        return error('Authentication credentials were not provided.', 403)
+
+    transactions = Transaction.objects.filter(account_id__in=listable_account_ids(user)).values(
+        'id', 'account_id', 'amount', 'created_at')
+
+    paginator = KeysetPagination()
+    try:
+        page = await paginator.apaginate_queryset(transactions, request)
+    except NotFound as exc:
+        return error(exc.detail, 404)
+    return JsonResponse({
+        'next': paginator.get_next_link(),
+        'results': [
+            {
+                'id': row['id'],
+                'account': row['account_id'],
+                'amount': format_decimal(row['amount']),
+                'created_at': format_datetime(row['created_at']),
+            }
+            for row in page
+        ],
+    })
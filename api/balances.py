@@ -0,0 +1,161 @@
+from collections import defaultdict
+import heapq
+from itertools import groupby
+from operator import itemgetter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .archive import needs_archive
+from .models import ArchivedTransaction, DailyBalance, InvestmentAccount, Transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def cents(value):
+    """Round a summed amount to cents; SQLite adds decimals as floats."""
+    return (value or Decimal('0.00')).quantize(Decimal('0.01'))
+
+
+def day_of(value):
+    """Return the calendar day a timestamp is rolled up under (current time zone)."""
+    if timezone.is_aware(value):
+        return timezone.localdate(value)
+    return value.date()
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def day_end(day):
+    return timezone.make_aware(datetime.combine(day, datetime.max.time()))
+
+
+def apply_delta(account_id, delta):
+    """Add ``delta`` to the stored balance of an account in a single UPDATE."""
+    if account_id is None or not delta:
+        return
+    InvestmentAccount.objects.filter(pk=account_id).update(balance=F('balance') + delta)
+
+
+def apply_daily_delta(account_id, day, delta, count):
+    """Add ``delta`` and ``count`` to the rollup row of an account for ``day``, creating it if needed."""
+    if account_id is None or (not delta and not count):
+        return
+    rows = DailyBalance.objects.filter(account_id=account_id, date=day)
+    if rows.update(total=F('total') + delta, count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            DailyBalance.objects.create(account_id=account_id, date=day, total=delta, count=count)
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(total=F('total') + delta, count=F('count') + count)
+
+
+def account_balance(account_id):
+    """Return the materialized balance of an account without scanning its transactions."""
+    balance = InvestmentAccount.objects.filter(pk=account_id).values_list('balance', flat=True).first()
+    return balance if balance is not None else Decimal('0.00')
+
+
+def range_total(account_id, start, end):
+    """
+    Return the sum of an account's transactions with ``start <= created_at <= end``.
+
+    Whole days inside the range are read from the daily rollup; raw rows are
+    only scanned for the partial days at either edge.
+    """
+    first_day, last_day = day_of(start), day_of(end)
+    if day_start(first_day) < start:
+        first_day += timedelta(days=1)
+    if day_end(last_day) > end:
+        last_day -= timedelta(days=1)
+
+    def raw_total(since, **lookups):
+        # Edges old enough to be archived are summed from both tables
+        models = [Transaction, ArchivedTransaction] if needs_archive(account_id, since) else [Transaction]
+        return sum((
+            cents(model.objects.filter(account_id=account_id, **lookups).aggregate(Sum('amount'))['amount__sum'])
+            for model in models
+        ), Decimal('0.00'))
+
+    if first_day > last_day:
+        return raw_total(start, created_at__range=[start, end])
+
+    total = cents(DailyBalance.objects.filter(
+        account_id=account_id, date__range=[first_day, last_day]
+    ).aggregate(Sum('total'))['total__sum'])
+    if start < day_start(first_day):
+        total += raw_total(start, created_at__gte=start, created_at__lt=day_start(first_day))
+    if end > day_end(last_day):
+        total += raw_total(day_end(last_day), created_at__gt=day_end(last_day), created_at__lte=end)
+    return total
+
+
+def rebuild_balances(account_ids=None, dry_run=False):
+    """
+    Recompute balances from the hot and archived transactions and fix any that drifted.
+
+    Returns a list of ``(account_id, stored, actual)`` tuples for the accounts
+    whose stored balance did not match.
+    """
+    accounts = InvestmentAccount.objects.all()
+    if account_ids:
+        accounts = accounts.filter(pk__in=account_ids)
+
+    totals = defaultdict(Decimal)
+    for model in (Transaction, ArchivedTransaction):
+        transactions = model.objects.all()
+        if account_ids:
+            transactions = transactions.filter(account_id__in=account_ids)
+        for account_id, total in transactions.values('account_id').annotate(total=Sum('amount')).values_list('account_id', 'total'):
+            totals[account_id] += cents(total)
+
+    mismatches = []
+    for account_id, stored in accounts.values_list('id', 'balance').iterator():
+        actual = cents(totals.get(account_id))
+        if stored != actual:
+            mismatches.append((account_id, stored, actual))
+            if not dry_run:
+                InvestmentAccount.objects.filter(pk=account_id).update(balance=actual)
+    return mismatches
+
+
+def rebuild_daily_balances(account_ids=None, batch_size=1000):
+    """Rebuild the daily rollup from the hot and archived transactions. Returns the number of rows written."""
+    rollups = DailyBalance.objects.all()
+    if account_ids:
+        rollups = rollups.filter(account_id__in=account_ids)
+    rollups.delete()
+
+    streams = []
+    for model in (Transaction, ArchivedTransaction):
+        transactions = model.objects.all()
+        if account_ids:
+            transactions = transactions.filter(account_id__in=account_ids)
+        streams.append(
+            transactions.annotate(day=TruncDate('created_at'))
+            .values('account_id', 'day')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by('account_id', 'day')
+            .iterator()
+        )
+    # A day can have rows in both tables, so the two ordered streams are merged per (account, day)
+    key = itemgetter('account_id', 'day')
+    written = 0
+    batch = []
+    for (account_id, day), rows in groupby(heapq.merge(*streams, key=key), key=key):
+        rows = list(rows)
+        total = sum((cents(row['total']) for row in rows), Decimal('0.00'))
+        batch.append(DailyBalance(account_id=account_id, date=day, total=total, count=sum(row['count'] for row in rows)))
+        if len(batch) >= batch_size:
+            DailyBalance.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    DailyBalance.objects.bulk_create(batch)
+    return written + len(batch)
@@ -0,0 +1,81 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has changed since it was read. Fetch it again and retry.'
+    default_code = 'precondition_failed'
+
+
+def object_etag(instance):
+    return f'"v{instance.version}"'
+
+
+def check_if_match(request, instance):
+    """Raise PreconditionFailed unless the If-Match header, when sent, names the stored version."""
+    header = request.headers.get('If-Match')
+    if header is None:
+        return
+    etags = parse_etags(header)
+    if '*' not in etags and object_etag(instance) not in etags:
+        raise PreconditionFailed()
+
+
+def lock_row(queryset, pk):
+    """
+    Lock a row until the end of the current transaction and return it freshly read.
+
+    select_for_update() takes the row lock on PostgreSQL. SQLite ignores it and
+    locks the whole database on the first write instead, so there a no-op
+    UPDATE takes the write lock before the row is read; a read first would let
+    two writers see the same version.
+    """
+    connection = connections[router.db_for_write(queryset.model)]
+    if not connection.features.has_select_for_update:
+        queryset.filter(pk=pk).update(version=F('version'))
+    return get_object_or_404(queryset.select_for_update(), pk=pk)
+
+
+class OptimisticConcurrencyMixin:
+    """
+    ModelViewSet mixin for models with a ``version`` column.
+
+    Retrieve and update responses carry a strong ETag of the row's version and
+    retrieve honours If-None-Match. Updates and deletes honour If-Match with a
+    412, and run on the row re-read under a short lock, so concurrent writers
+    never apply changes (or balance deltas) computed from a stale copy.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = object_etag(instance)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(self.get_serializer(instance).data, headers={'ETag': etag})
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = object_etag(self.updated_instance)
+        return response
+
+    def lock_object(self, instance):
+        current = lock_row(self.get_queryset(), instance.pk)
+        # The locked row may differ from the one the permissions were checked against
+        self.check_object_permissions(self.request, current)
+        check_if_match(self.request, current)
+        return current
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.instance = self.lock_object(serializer.instance)
+            self.updated_instance = serializer.save(version=serializer.instance.version + 1)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            self.lock_object(instance).delete()
@@ -0,0 +1,44 @@
+from django.utils import timezone
+
+
+def format_decimal(value, decimal_places=2):
+    """Format a Decimal the way DRF's DecimalField renders it (a fixed-point string)."""
+    if value is None:
+        return None
+    return f"{value:.{decimal_places}f}"
+
+
+def format_datetime(value, tz=None):
+    """
+    Format a datetime the way DRF's DateTimeField renders it (ISO 8601, 'Z' for UTC).
+
+    Aware values are converted to ``tz``, the current time zone by default;
+    callers formatting many values pass it in to look it up only once.
+    """
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = value.astimezone(tz or timezone.get_current_timezone())
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def transaction_values(transactions):
+    """The columns TransactionSerializer outputs, as named rows instead of model instances."""
+    return transactions.values_list('id', 'account_id', 'amount', 'created_at', named=True)
+
+
+def transaction_rows(rows):
+    """Format rows from transaction_values() exactly as TransactionSerializer would."""
+    tz = timezone.get_current_timezone()
+    return [
+        {
+            'id': row.id,
+            'account': row.account_id,
+            'amount': format_decimal(row.amount),
+            'created_at': format_datetime(row.created_at, tz),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,77 @@
+import csv
+import heapq
+import json
+import zlib
+from .encoders import format_datetime, format_decimal
+
+EXPORT_FIELDS = ['id', 'account', 'user', 'amount', 'created_at']
+EXPORT_CHUNK_SIZE = 2000
+# Rows are joined into blocks of about this many bytes before being written out
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer produces strings."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(transactions, chunk_size=EXPORT_CHUNK_SIZE, archived=None):
+    """
+    Yield ``(id, account, user, amount, created_at)`` tuples using a server-side cursor.
+
+    ``archived`` rows, when given, are read through a second cursor and merged in order.
+    """
+    streams = [
+        queryset.order_by('created_at', 'id').values_list(
+            'id', 'account_id', 'user_id', 'amount', 'created_at').iterator(chunk_size=chunk_size)
+        for queryset in ([transactions] if archived is None else [transactions, archived])
+    ]
+    rows = streams[0] if len(streams) == 1 else heapq.merge(*streams, key=lambda row: (row[4], row[0]))
+    for pk, account_id, user_id, amount, created_at in rows:
+        yield pk, account_id, user_id, format_decimal(amount), format_datetime(created_at)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), separators=(',', ':')) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def buffered(lines, size=EXPORT_BUFFER_SIZE):
+    """Join small strings into blocks of roughly ``size`` bytes, encoded as UTF-8."""
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer).encode()
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def gzipped(blocks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_transactions(transactions, export_format, compress=False, chunk_size=EXPORT_CHUNK_SIZE, archived=None):
+    """Return an iterator of byte blocks encoding ``transactions`` (and ``archived``) as NDJSON or CSV."""
+    rows = export_rows(transactions, chunk_size=chunk_size, archived=archived)
+    lines = csv_lines(rows) if export_format == 'csv' else ndjson_lines(rows)
+    blocks = buffered(lines)
+    return gzipped(blocks) if compress else blocks
@@ -0,0 +1,87 @@
+"""
+Bulk changes to the user/account permission matrix.
+
+apply_changes() writes a whole set of grants and revokes in one database
+transaction: grants are upserted with batched INSERT ... ON CONFLICT (user,
+account) DO UPDATE statements, revokes are looked up and deleted by primary
+key in batches. The per-row signal handlers are skipped, so the permission
+caches of the affected users and the cached responses of the affected
+accounts are invalidated here, once per user and account instead of once per
+row.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from . import response_cache
+from .models import UserAccountPermission
+from .permission_cache import permission_cache
+
+DEFAULT_BATCH_SIZE = 1000
+
+# True while apply_changes() deletes revoked rows; the permission signal handler skips them then
+applying = ContextVar('applying_permission_changes', default=False)
+
+
+@contextmanager
+def applying_changes():
+    token = applying.set(True)
+    try:
+        yield
+    finally:
+        applying.reset(token)
+
+
+def existing_ids(model, ids, batch_size=DEFAULT_BATCH_SIZE):
+    """The subset of ``ids`` that are primary keys of ``model``, looked up in batches."""
+    ids = sorted(set(ids))
+    found = set()
+    for start in range(0, len(ids), batch_size):
+        found.update(model.objects.filter(pk__in=ids[start:start + batch_size]).values_list('pk', flat=True))
+    return found
+
+
+def _revoke(pairs, batch_size):
+    """Delete the permission rows of ``pairs``, looking up their primary keys first."""
+    pairs = sorted(pairs)
+    pks = []
+    for start in range(0, len(pairs), batch_size):
+        batch = set(pairs[start:start + batch_size])
+        # Users x accounts of the batch is a superset of its pairs, narrowed down here
+        rows = UserAccountPermission.objects.filter(
+            user_id__in={user_id for user_id, _ in batch},
+            account_id__in={account_id for _, account_id in batch},
+        ).values_list('pk', 'user_id', 'account_id')
+        pks.extend(pk for pk, user_id, account_id in rows if (user_id, account_id) in batch)
+
+    deleted = 0
+    with applying_changes():
+        for start in range(0, len(pks), batch_size):
+            deleted += UserAccountPermission.objects.filter(pk__in=pks[start:start + batch_size]).delete()[0]
+    return deleted
+
+
+def apply_changes(grants, revokes, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Upsert ``grants``, a ``{(user_id, account_id): permission}`` dict, and
+    delete the ``(user_id, account_id)`` pairs in ``revokes``, atomically.
+
+    Returns the number of permission rows deleted.
+    """
+    users = {user_id for user_id, _ in grants} | {user_id for user_id, _ in revokes}
+    accounts = {account_id for _, account_id in grants} | {account_id for _, account_id in revokes}
+    with transaction.atomic():
+        UserAccountPermission.objects.bulk_create(
+            [UserAccountPermission(user_id=user_id, account_id=account_id, permission=permission)
+             for (user_id, account_id), permission in grants.items()],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user', 'account'],
+            update_fields=['permission'],
+        )
+        deleted = _revoke(revokes, batch_size)
+
+        permission_cache.invalidate_many(users)
+        # Again on commit in case another request cached the old rows in between
+        transaction.on_commit(lambda: permission_cache.invalidate_many(users))
+        response_cache.bump_accounts(accounts)
+    return deleted
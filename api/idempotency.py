@@ -0,0 +1,126 @@
+from datetime import timedelta
+from functools import wraps
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .models import IdempotencyKey
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def get_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+
+def get_cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def cache_key(user_id, key):
+    # Hash the client's key so any header value is a valid cache key
+    return f"idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def fingerprint(request):
+    """Hash of what was asked for, so a key reused for a different request is rejected."""
+    payload = json.dumps([request.method, request.path, request.data], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay(stored_fingerprint, status_code, body, request_fingerprint):
+    if stored_fingerprint != request_fingerprint:
+        return Response({'detail': f'{HEADER} was already used for a different request.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(body, status=status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def lookup(user, key):
+    """Return ``(fingerprint, status_code, body)`` of a stored response, or None."""
+    cache = get_cache()
+    stored = cache.get(cache_key(user.pk, key))
+    if stored is not None:
+        return stored
+
+    record = IdempotencyKey.objects.filter(user=user, key=key, expires_at__gt=timezone.now()).first()
+    if record is None:
+        return None
+    stored = (record.fingerprint, record.status_code, record.response_body)
+    remaining = (record.expires_at - timezone.now()).total_seconds()
+    if remaining > 0:
+        cache.set(cache_key(user.pk, key), stored, remaining)
+    return stored
+
+
+def idempotent(view_method):
+    """
+    Make a POST handler honour the ``Idempotency-Key`` header.
+
+    The first request with a key runs the handler and stores its response in
+    the same database transaction as the handler's writes. Later requests with
+    the same key get the stored response back from the local cache (or the
+    IdempotencyKey table) without running the handler again. Responses are kept
+    for ``IDEMPOTENCY_KEY_TTL`` seconds; server errors are never stored.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({HEADER: [f'Ensure this header has no more than {MAX_KEY_LENGTH} characters.']})
+
+        user = request.user
+        request_fingerprint = fingerprint(request)
+        stored = lookup(user, key)
+        if stored is not None:
+            logger.debug("Replaying response for idempotency key %r", key)
+            return replay(*stored, request_fingerprint)
+
+        conflict = False
+        with transaction.atomic():
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code < 500:
+                now = timezone.now()
+                ttl = get_ttl()
+                IdempotencyKey.objects.filter(user=user, key=key, expires_at__lte=now).delete()
+                try:
+                    with transaction.atomic():
+                        IdempotencyKey.objects.create(
+                            user=user, key=key, fingerprint=request_fingerprint, status_code=response.status_code,
+                            response_body=response.data, created_at=now, expires_at=now + timedelta(seconds=ttl))
+                except IntegrityError:
+                    # A concurrent request with the same key committed first, so undo this one
+                    transaction.set_rollback(True)
+                    conflict = True
+                else:
+                    stored = (request_fingerprint, response.status_code,
+                              json.loads(json.dumps(response.data, cls=DjangoJSONEncoder)))
+                    transaction.on_commit(lambda: get_cache().set(cache_key(user.pk, key), stored, ttl))
+
+        if conflict:
+            stored = lookup(user, key)
+            if stored is not None:
+                return replay(*stored, request_fingerprint)
+            return Response({'detail': f'A request with this {HEADER} is already in progress.'},
+                            status=status.HTTP_409_CONFLICT)
+        return response
+
+    return wrapper
+
+
+def prune_expired(now=None):
+    """Delete expired idempotency keys. Returns the number deleted."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,113 @@
+"""
+Database-backed job queue for work too slow for a request thread.
+
+Views enqueue a Job and answer 202; ``manage.py run_worker`` processes claim
+queued jobs, run the handler registered for their kind in HANDLERS and
+store its result. Handlers that produce a file write it under
+``JOB_RESULT_DIR`` and set ``job.result_file``; the job endpoints serve it.
+"""
+from datetime import timedelta
+import os
+from pathlib import Path
+import socket
+import time
+from django.conf import settings
+from django.db import close_old_connections, connection, router
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job kind -> dotted path of its handler, which takes the Job and returns a JSON-serializable result
+HANDLERS = {
+    'report': 'api.tasks.report',
+    'rebuild_balances': 'api.tasks.rebuild_balances',
+    'rebuild_daily_balances': 'api.tasks.rebuild_daily_balances',
+    'rebuild_projections': 'api.tasks.rebuild_projections',
+}
+
+# Kinds only staff may enqueue through the job endpoint; reports have their own endpoint
+ADMIN_KINDS = ('rebuild_balances', 'rebuild_daily_balances', 'rebuild_projections')
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_TIMEOUT = 60 * 60
+
+
+def result_dir():
+    return Path(getattr(settings, 'JOB_RESULT_DIR', Path(settings.BASE_DIR) / 'job_results'))
+
+
+def result_path(job):
+    return result_dir() / job.result_file if job.result_file else None
+
+
+def enqueue(kind, params=None, user=None):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}.")
+    return Job.objects.create(kind=kind, params=params or {}, user=user)
+
+
+def claim(worker):
+    """
+    Mark the oldest queued job as running for ``worker`` and return it, or None.
+
+    Jobs left running longer than JOB_TIMEOUT seconds, by a worker that died,
+    are claimed again. The status moves with a compare-and-set, so two
+    workers never get the same job.
+    """
+    jobs = Job.objects.using(router.db_for_write(Job))
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', DEFAULT_TIMEOUT))
+    candidates = (
+        jobs.filter(Q(status=Job.QUEUED) | Q(status=Job.RUNNING, started_at__lt=stale))
+        .order_by('created_at', 'id')
+        .values_list('id', 'status', 'started_at')[:10]
+    )
+    for pk, status, started_at in candidates:
+        if jobs.filter(pk=pk, status=status, started_at=started_at).update(
+                status=Job.RUNNING, started_at=now, worker=worker):
+            return jobs.get(pk=pk)
+    return None
+
+
+def run(job):
+    """Run a claimed job's handler and record how it ended."""
+    logger.info("Running job %s (%s)", job.pk, job.kind, extra={'job_id': job.pk, 'kind': job.kind})
+    try:
+        job.result = import_string(HANDLERS[job.kind])(job)
+        job.status = Job.DONE
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", job.pk, job.kind, extra={'job_id': job.pk, 'kind': job.kind})
+        job.status = Job.FAILED
+        job.error = f"{type(exc).__name__}: {exc}"
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'result_file', 'error', 'finished_at'])
+    return job
+
+
+def work(worker=None, poll_interval=None, burst=False):
+    """
+    Claim and run jobs until stopped; with ``burst``, until the queue is empty.
+
+    Returns the number of jobs run.
+    """
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    if poll_interval is None:
+        poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    done = 0
+    while True:
+        # Long-lived process: drop connections that are broken or past CONN_MAX_AGE,
+        # unless a caller's transaction is still open on them (a burst run inside atomic())
+        if not connection.in_atomic_block:
+            close_old_connections()
+        job = claim(worker)
+        if job is not None:
+            run(job)
+            done += 1
+        elif burst:
+            return done
+        else:
+            time.sleep(poll_interval)
@@ -0,0 +1,376 @@
+"""
+Append-only ledger of balance changes, and the projections built from it.
+
+Every create, update and delete of a transaction appends LedgerEvents in the
+same database transaction: ``create`` (+amount, +1 row), ``adjust`` (an
+amount change within the same account, day and user) and ``reverse``
+(-amount, -1 row). A move to another account, day or user is a reverse of
+the old values plus a create of the new ones. Events are numbered per
+account by ``InvestmentAccount.ledger_sequence``, reserved under the
+account's row lock, so they commit in sequence order.
+
+Projections fold events into read models. Inline projections (the account
+balance and the daily rollup) are applied as events are appended, so they
+are always at the head of the log. Checkpointed projections (per-user
+totals) record the last sequence they applied per account and catch up on
+the events after it when read. Any projection can be rebuilt from sequence
+zero with the rebuild_projections command.
+"""
+from collections import defaultdict
+import heapq
+from decimal import Decimal
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Sum, Value, When
+from .balances import apply_daily_delta, apply_delta, day_of
+from .models import (
+    ArchivedTransaction, DailyBalance, InvestmentAccount, LedgerEvent, ProjectionCheckpoint, Transaction, UserBalance,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Change in an account's row count for each kind of event
+COUNT_DELTA = {LedgerEvent.CREATE: 1, LedgerEvent.ADJUST: 0, LedgerEvent.REVERSE: -1}
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+class LedgerIncomplete(Exception):
+    """Raised when the ledger does not account for every stored transaction, so a replay would lose rows."""
+
+
+def _event(kind, transaction_id, values, amount):
+    account_id, _, created_at, user_id = values
+    return LedgerEvent(
+        account_id=account_id, kind=kind, transaction_id=transaction_id,
+        user_id=user_id, amount=amount, created_at=created_at,
+    )
+
+
+def _values(instance):
+    return (instance.account_id, Decimal(instance.amount), instance.created_at, instance.user_id)
+
+
+def saved_events(instance, created):
+    """Events for a created or updated transaction, diffed against what was stored."""
+    current = _values(instance)
+    stored = getattr(instance, '_stored', None)
+    instance._stored = current
+    if created:
+        return [_event(LedgerEvent.CREATE, instance.pk, current, current[1])]
+    if stored is None or stored[0] is None:
+        # Not loaded from the database, so there is nothing to diff against
+        logger.warning("Ledger not updated for transaction %s of account %s", instance.pk, instance.account_id)
+        return []
+    old_account_id, old_amount, old_created_at, old_user_id = stored
+    if (old_account_id, day_of(old_created_at), old_user_id) == (current[0], day_of(current[2]), current[3]):
+        delta = current[1] - old_amount
+        return [_event(LedgerEvent.ADJUST, instance.pk, current, delta)] if delta else []
+    return [
+        _event(LedgerEvent.REVERSE, instance.pk, stored, -old_amount),
+        _event(LedgerEvent.CREATE, instance.pk, current, current[1]),
+    ]
+
+
+def deleted_events(instance):
+    stored = getattr(instance, '_stored', None) or _values(instance)
+    return [_event(LedgerEvent.REVERSE, instance.pk, stored, -Decimal(stored[1]))]
+
+
+def created_events(transactions):
+    """Events for rows inserted with bulk_create, which sends no signals."""
+    events = []
+    for instance in transactions:
+        instance._stored = _values(instance)
+        events.append(_event(LedgerEvent.CREATE, instance.pk, instance._stored, instance._stored[1]))
+    return events
+
+
+def reserve_sequences(events):
+    """Number ``events`` after each account's last event, in list order; call inside a transaction."""
+    by_account = defaultdict(list)
+    for event in events:
+        by_account[event.account_id].append(event)
+    for account_id, account_events in by_account.items():
+        accounts = InvestmentAccount.objects.filter(pk=account_id)
+        # The UPDATE takes the account's row lock, so concurrent writers get consecutive ranges
+        accounts.update(ledger_sequence=F('ledger_sequence') + len(account_events))
+        last = accounts.values_list('ledger_sequence', flat=True).get()
+        for offset, event in enumerate(account_events, start=last - len(account_events) + 1):
+            event.sequence = offset
+
+
+def append(events, batch_size=None):
+    """
+    Store ``events`` and apply them to the inline projections.
+
+    Call inside the writing transaction. Outside one (a save() from the shell
+    or a script) it opens its own, since the sequence range is only reserved
+    while the transaction holds the account's row lock.
+    """
+    if not events:
+        return events
+    with transaction.atomic():
+        reserve_sequences(events)
+        LedgerEvent.objects.bulk_create(events, batch_size=batch_size)
+        for projection in PROJECTIONS.values():
+            if projection.inline:
+                projection.apply(events)
+    return events
+
+
+def record_saved(instance, created):
+    return append(saved_events(instance, created))
+
+
+def record_deleted(instance):
+    return append(deleted_events(instance))
+
+
+def record_created(transactions, batch_size=None):
+    return append(created_events(transactions), batch_size=batch_size)
+
+
+class Projection:
+    """Read model folded from ledger events. Subclasses implement reset() and apply()."""
+    name = None
+    # Inline projections are applied as events are appended and need no checkpoint
+    inline = False
+
+    def reset(self, account_ids=None):
+        """Return the read model of these accounts (all when None) to its state before any event."""
+        raise NotImplementedError
+
+    def apply(self, events):
+        """Fold ``events`` into the read model; applying them in several batches gives the same result."""
+        raise NotImplementedError
+
+
+class BalanceProjection(Projection):
+    name = 'balance'
+    inline = True
+
+    def reset(self, account_ids=None):
+        accounts = InvestmentAccount.objects.all()
+        if account_ids:
+            accounts = accounts.filter(pk__in=account_ids)
+        accounts.update(balance=0)
+
+    def apply(self, events):
+        deltas = defaultdict(Decimal)
+        for event in events:
+            deltas[event.account_id] += Decimal(event.amount)
+        for account_id, delta in deltas.items():
+            apply_delta(account_id, delta)
+
+
+class DailyBalanceProjection(Projection):
+    name = 'daily'
+    inline = True
+
+    def reset(self, account_ids=None):
+        rollups = DailyBalance.objects.all()
+        if account_ids:
+            rollups = rollups.filter(account_id__in=account_ids)
+        rollups.delete()
+
+    def apply(self, events):
+        days = defaultdict(lambda: [Decimal('0.00'), 0])
+        for event in events:
+            day = days[event.account_id, day_of(event.created_at)]
+            day[0] += Decimal(event.amount)
+            day[1] += COUNT_DELTA[event.kind]
+        for (account_id, day), (delta, count) in days.items():
+            apply_daily_delta(account_id, day, delta, count)
+
+
+class UserBalanceProjection(Projection):
+    name = 'user_totals'
+
+    def reset(self, account_ids=None):
+        for model in (UserBalance, ProjectionCheckpoint):
+            rows = model.objects.all()
+            if model is ProjectionCheckpoint:
+                rows = rows.filter(projection=self.name)
+            if account_ids:
+                rows = rows.filter(account_id__in=account_ids)
+            rows.delete()
+
+    def apply(self, events):
+        users = defaultdict(lambda: [Decimal('0.00'), 0])
+        for event in events:
+            user = users[event.account_id, event.user_id]
+            user[0] += Decimal(event.amount)
+            user[1] += COUNT_DELTA[event.kind]
+        for (account_id, user_id), (delta, count) in users.items():
+            rows = UserBalance.objects.filter(account_id=account_id, user_id=user_id)
+            if rows.update(total=F('total') + delta, count=F('count') + count):
+                continue
+            try:
+                with transaction.atomic():
+                    UserBalance.objects.create(account_id=account_id, user_id=user_id, total=delta, count=count)
+            except IntegrityError:
+                # Another catch-up created the row first
+                rows.update(total=F('total') + delta, count=F('count') + count)
+
+
+PROJECTIONS = {
+    projection.name: projection
+    for projection in (BalanceProjection(), DailyBalanceProjection(), UserBalanceProjection())
+}
+
+
+class _Overtaken(Exception):
+    pass
+
+
+def catch_up(projection, account_id):
+    """
+    Apply the account's events after the projection's checkpoint. Returns how many were applied.
+
+    Runs on the primary, so a read routed to a replica never advances the
+    checkpoint past events it could not see. The checkpoint moves with a
+    compare-and-set; when a concurrent catch-up got there first, this one is
+    rolled back and applies nothing. The checkpoint row is only created once
+    there are events, so an unknown account id writes nothing.
+    """
+    if projection.inline:
+        return 0
+    using = router.db_for_write(LedgerEvent)
+    checkpoints = ProjectionCheckpoint.objects.using(using).filter(projection=projection.name, account_id=account_id)
+    try:
+        with transaction.atomic(using=using):
+            checkpoint = checkpoints.first()
+            sequence = checkpoint.sequence if checkpoint is not None else 0
+            events = list(LedgerEvent.objects.using(using).filter(
+                account_id=account_id, sequence__gt=sequence).order_by('sequence'))
+            if not events:
+                return 0
+            if checkpoint is None:
+                checkpoint, _ = checkpoints.get_or_create(projection=projection.name, account_id=account_id)
+            projection.apply(events)
+            moved = checkpoints.filter(pk=checkpoint.pk, sequence=sequence).update(sequence=events[-1].sequence)
+            if not moved:
+                raise _Overtaken()
+    except _Overtaken:
+        return 0
+    return len(events)
+
+
+def user_total(account_id, user_id):
+    """The user's total on the account from the per-user projection, caught up first."""
+    catch_up(PROJECTIONS['user_totals'], account_id)
+    total = UserBalance.objects.using(router.db_for_write(UserBalance)).filter(
+        account_id=account_id, user_id=user_id).values_list('total', flat=True).first()
+    return total if total is not None else Decimal('0.00')
+
+
+def check(account_ids=None):
+    """
+    Raise LedgerIncomplete when an account's live rows per the ledger differ from its stored rows.
+
+    Creates minus reverses must equal the hot plus archived transactions,
+    which is what rebuild_balances sums; otherwise a replay and a rebuild
+    from the rows would silently disagree.
+    """
+    net = Sum(Case(
+        When(kind=LedgerEvent.CREATE, then=Value(1)),
+        When(kind=LedgerEvent.REVERSE, then=Value(-1)),
+        default=Value(0), output_field=IntegerField(),
+    ))
+    events = LedgerEvent.objects.all()
+    if account_ids:
+        events = events.filter(account_id__in=account_ids)
+    expected = defaultdict(int, events.values('account_id').annotate(rows=net).values_list('account_id', 'rows'))
+
+    stored = defaultdict(int)
+    for model in (Transaction, ArchivedTransaction):
+        rows = model.objects.all()
+        if account_ids:
+            rows = rows.filter(account_id__in=account_ids)
+        for account_id, count in rows.values('account_id').annotate(rows=Count('id')).values_list('account_id', 'rows'):
+            stored[account_id] += count
+
+    mismatched = sorted(
+        account_id for account_id in set(expected) | set(stored) if expected[account_id] != stored[account_id]
+    )
+    if mismatched:
+        raise LedgerIncomplete(
+            f"The ledger does not match the stored transactions of account(s) "
+            f"{', '.join(map(str, mismatched))}; seed the ledger first."
+        )
+
+
+def rebuild(projection, account_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Reset a projection and replay the ledger into it from sequence zero. Returns the number of events.
+
+    Raises LedgerIncomplete, before touching the projection, when an account
+    has transactions the ledger does not know about; seed() them first.
+    """
+    check(account_ids)
+    projection.reset(account_ids)
+    events = LedgerEvent.objects.order_by('account_id', 'sequence')
+    if account_ids:
+        events = events.filter(account_id__in=account_ids)
+
+    replayed = 0
+    batch = []
+    for event in events.iterator(chunk_size=batch_size):
+        batch.append(event)
+        if len(batch) >= batch_size:
+            projection.apply(batch)
+            replayed += len(batch)
+            batch = []
+    projection.apply(batch)
+    replayed += len(batch)
+
+    if not projection.inline:
+        heads = events.order_by().values('account_id').annotate(sequence=Max('sequence'))
+        ProjectionCheckpoint.objects.bulk_create([
+            ProjectionCheckpoint(projection=projection.name, account_id=row['account_id'], sequence=row['sequence'])
+            for row in heads
+        ], batch_size=batch_size)
+    return replayed
+
+
+def seed(account_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write create events for transactions that have no ledger event.
+
+    For data that predates the ledger or was bulk-loaded without it, including
+    older rows of accounts that have been written to since. Hot and archived
+    rows are appended together in (created_at, id) order after the account's
+    last event; balances and rollups are left alone, they already include
+    these rows. Returns the number of events written.
+    """
+    accounts = InvestmentAccount.objects.all()
+    if account_ids:
+        accounts = accounts.filter(pk__in=account_ids)
+    seeded = 0
+    for account_id in list(accounts.values_list('pk', flat=True)):
+        recorded = LedgerEvent.objects.filter(account_id=account_id).values('transaction_id')
+        streams = [
+            model.objects.filter(account_id=account_id).exclude(pk__in=recorded).order_by('created_at', 'id')
+            .values_list('created_at', 'id', 'amount', 'user_id').iterator(chunk_size=batch_size)
+            for model in (Transaction, ArchivedTransaction)
+        ]
+        batch = []
+        for created_at, pk, amount, user_id in heapq.merge(*streams):
+            batch.append(LedgerEvent(
+                account_id=account_id, kind=LedgerEvent.CREATE, transaction_id=pk,
+                user_id=user_id, amount=amount, created_at=created_at,
+            ))
+            if len(batch) >= batch_size:
+                seeded += _store_seeded(batch)
+                batch = []
+        seeded += _store_seeded(batch)
+    return seeded
+
+
+def _store_seeded(events):
+    if events:
+        with transaction.atomic():
+            reserve_sequences(events)
+            LedgerEvent.objects.bulk_create(events)
+    return len(events)
@@ -0,0 +1,58 @@
+import json
+import logging
+import random
+from django.conf import settings
+
+# Set through ``extra`` on records whose sampling was decided by sampled(), so it is not applied twice
+PRESAMPLED = 'presampled'
+
+# Attributes every LogRecord has; anything else on a record came in through ``extra``
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', PRESAMPLED}
+
+
+def sampled(logger, level=logging.DEBUG):
+    """
+    Decide before building a costly record whether it would be kept.
+
+    True when ``logger`` is enabled for ``level`` and the record survives
+    API_LOG_SAMPLE_RATE. Log it with ``extra={PRESAMPLED: True}`` so
+    SamplingFilter lets it through.
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    rate = getattr(settings, 'API_LOG_SAMPLE_RATE', 1.0)
+    return level >= logging.WARNING or rate >= 1 or random.random() < rate
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through only a ``rate`` fraction of records below WARNING.
+
+    Warnings and errors always pass, so sampling only thins out the per-request
+    debug and info chatter on hot paths.
+    """
+
+    def __init__(self, rate=1.0, name=''):
+        super().__init__(name)
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1 or getattr(record, PRESAMPLED, False):
+            return True
+        return random.random() < self.rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including any ``extra`` fields."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in RESERVED_ATTRS)
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
@@ -0,0 +1,45 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.archive import archive_horizon, archive_transactions
+from api.models import Transaction
+from api.response_cache import bump_accounts
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transactions older than TRANSACTION_ARCHIVE_AFTER_DAYS out of the hot table into "
+        "the archive. Balances and daily rollups are unchanged; admin_transactions and the "
+        "export read the archive when the requested range reaches into it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help="Archive transactions older than this many days instead of the setting.")
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help="Only archive this account id (may be repeated).")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows moved per transaction (default TRANSACTION_ARCHIVE_BATCH_SIZE).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report how many transactions are due without moving them.")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError("--days must not be negative.")
+        if options['days'] is None:
+            before = archive_horizon()
+        else:
+            before = timezone.now() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            due = Transaction.objects.filter(created_at__lt=before)
+            if options['accounts']:
+                due = due.filter(account_id__in=options['accounts'])
+            self.stdout.write(f"{due.count()} transaction(s) created before {before:%Y-%m-%d %H:%M} are due.")
+            return
+
+        accounts, moved = archive_transactions(before, options['batch_size'], options['accounts'])
+        # The transaction list no longer shows the moved rows
+        bump_accounts(accounts)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} transaction(s) from {len(accounts)} account(s)."))
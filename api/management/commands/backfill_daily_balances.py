@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.balances import rebuild_daily_balances
+from api.response_cache import bump_all
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-account daily balance rollup from the transaction table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help="Only rebuild this account id (may be repeated).")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of rollup rows inserted per query.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = rebuild_daily_balances(options['accounts'], batch_size=options['batch_size'])
+        # Range totals read the rollup, so cached responses may be stale
+        bump_all()
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily balance row(s)."))
@@ -0,0 +1,154 @@
+from datetime import timedelta
+import json
+import platform
+import time
+import tracemalloc
+from asgiref.sync import async_to_sync
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from api.models import UserAccountPermission
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(samples) - 1, round(percent / 100 * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure p50/p95/p99 latency, query count and peak memory of each API endpoint through "
+        "Django's in-process handlers, and print the results as JSON. Run it against a dataset "
+        "made with generate_dataset, on SQLite or a local Postgres."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="Regular user the account endpoints are read as.")
+        parser.add_argument('--admin-username', help="Staff user for the admin endpoints; they are skipped without one.")
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per endpoint.")
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help="Only run this endpoint (may be repeated).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        user = self.get_user(options['username'])
+        admin = self.get_user(options['admin_username']) if options['admin_username'] else None
+
+        account_id = UserAccountPermission.objects.filter(
+            user=user, permission__in=[UserAccountPermission.VIEW_ONLY, UserAccountPermission.CRUD]
+        ).values_list('account_id', flat=True).first()
+        if account_id is None:
+            raise CommandError(f"User {user} cannot view any account.")
+
+        endpoints = self.get_endpoints(user, admin, account_id)
+        if options['endpoints']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['endpoints']]
+
+        results = {}
+        # The test clients send Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, client, url, params in endpoints:
+                results[name] = self.measure(client, url, params, options['iterations'], options['warmup'])
+                self.stderr.write(f"{name}: p50 {results[name]['p50_ms']}ms")
+
+        report = json.dumps({
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'endpoints': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    def get_user(self, username):
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User {username!r} does not exist.")
+
+    def get_endpoints(self, user, admin, account_id):
+        client = Client()
+        client.force_login(user)
+        async_client = AsyncClient()
+        async_client.cookies = client.cookies
+
+        today = timezone.localdate()
+        quarter = {'start_date': (today - timedelta(days=90)).isoformat(), 'end_date': today.isoformat()}
+        endpoints = [
+            ('account-list', client, reverse('investmentaccount-list'), {}),
+            ('account-detail', client, reverse('investmentaccount-detail', args=[account_id]), {}),
+            ('transaction-list', client, reverse('transaction-list'), {}),
+            ('async-account-list', async_client, reverse('async-investmentaccount-list'), {}),
+            ('async-transaction-list', async_client, reverse('async-transaction-list'), {}),
+        ]
+        if admin is not None:
+            admin_client = Client()
+            admin_client.force_login(admin)
+            endpoints += [
+                ('admin-transactions', admin_client, reverse('investmentaccount-admin-transactions', args=[account_id]), {}),
+                ('admin-transactions-range', admin_client,
+                 reverse('investmentaccount-admin-transactions', args=[account_id]), quarter),
+                ('export', admin_client, reverse('investmentaccount-export', args=[account_id]), {}),
+            ]
+        return endpoints
+
+    def request(self, client, url, params):
+        if isinstance(client, AsyncClient):
+            response = async_to_sync(client.get)(url, params)
+        else:
+            response = client.get(url, params)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}.")
+        # Consume streamed bodies so their cost is counted
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def measure(self, client, url, params, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url, params)
+
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            self.request(client, url, params)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        # Query counting and allocation tracing slow requests down, so they get separate passes
+        with CaptureQueriesContext(connection) as queries:
+            self.request(client, url, params)
+        # Read the count now, the captured queries are a view on a log the next request resets
+        query_count = len(queries)
+        tracemalloc.start()
+        try:
+            self.request(client, url, params)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'queries': query_count,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
@@ -0,0 +1,99 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.conf import settings
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from api.models import UserAccountPermission
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of the DRF (WSGI) read endpoints with their async (ASGI) "
+        "counterparts. Requests go through Django's in-process handlers, so the numbers exclude "
+        "the network and the HTTP server but include auth, ORM and rendering."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="User the requests are made as.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and path.")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at once.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+
+        account_id = UserAccountPermission.objects.filter(
+            user=user, permission__in=[UserAccountPermission.VIEW_ONLY, UserAccountPermission.CRUD]
+        ).values_list('account_id', flat=True).first()
+        if account_id is None:
+            raise CommandError(f"User {user} cannot view any account.")
+
+        login = Client()
+        login.force_login(user)
+        self.cookies = login.cookies
+
+        endpoints = [
+            ('account-list', reverse('investmentaccount-list'), reverse('async-investmentaccount-list')),
+            ('account-detail', reverse('investmentaccount-detail', args=[account_id]),
+             reverse('async-investmentaccount-detail', args=[account_id])),
+            ('transaction-list', reverse('transaction-list'), reverse('async-transaction-list')),
+        ]
+        results = []
+        for name, sync_url, async_url in endpoints:
+            # The test clients send Host: testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                wsgi_rps = self.run_wsgi(sync_url, options['requests'], options['concurrency'])
+                asgi_rps = asyncio.run(self.run_asgi(async_url, options['requests'], options['concurrency']))
+            results.append({
+                'endpoint': name,
+                'wsgi_rps': round(wsgi_rps, 1),
+                'asgi_rps': round(asgi_rps, 1),
+                'speedup': round(asgi_rps / wsgi_rps, 2) if wsgi_rps else None,
+            })
+
+        self.stdout.write(json.dumps({
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'results': results,
+        }, indent=2))
+
+    def check_response(self, response, url):
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}.")
+
+    def run_wsgi(self, url, requests, concurrency):
+        def worker(count):
+            client = Client()
+            client.cookies = self.cookies
+            try:
+                for _ in range(count):
+                    self.check_response(client.get(url), url)
+            finally:
+                connection.close()
+
+        counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker, count) for count in counts]:
+                future.result()
+        return requests / (time.perf_counter() - started)
+
+    async def run_asgi(self, url, requests, concurrency):
+        client = AsyncClient()
+        client.cookies = self.cookies
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with limit:
+                self.check_response(await client.get(url), url)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
@@ -0,0 +1,81 @@
+from datetime import timedelta
+from decimal import Decimal
+import json
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.encoders import transaction_rows, transaction_values
+from api.models import InvestmentAccount, Transaction
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare TransactionSerializer + JSONRenderer with the values_list fast path used by the "
+        "transaction list and admin_transactions. Both encode the same rows; the command fails "
+        "unless the bytes are identical. Rows are generated in a transaction that is rolled back, "
+        "or read from an existing account with --account."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per path; the best one is reported.")
+        parser.add_argument('--account', type=int, help="Encode this account's transactions instead of generated ones.")
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError("--rows and --repeat must be at least 1.")
+
+        with transaction.atomic():
+            account_id = options['account'] or self.generate(options['rows'])
+            transactions = Transaction.objects.filter(account_id=account_id).order_by('-created_at', '-id')
+            limit = options['rows']
+            # Fresh querysets on every run, so neither path is served from a result cache
+            serializer_ms, slow = self.best_of(options['repeat'], lambda: JSONRenderer().render(
+                TransactionSerializer(transactions[:limit], many=True).data))
+            fast_ms, fast = self.best_of(options['repeat'], lambda: FastJSONRenderer().render(
+                transaction_rows(transaction_values(transactions)[:limit])))
+            transaction.set_rollback(True)
+
+        report = {
+            'rows': len(json.loads(fast)),
+            'encoder': 'orjson' if orjson is not None else 'json',
+            'serializer_ms': round(serializer_ms, 1),
+            'fast_path_ms': round(fast_ms, 1),
+            'speedup': round(serializer_ms / fast_ms, 2) if fast_ms else None,
+            'bytes': len(fast),
+            'identical': slow == fast,
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+        if not report['identical']:
+            raise CommandError("The fast path output differs from TransactionSerializer's.")
+
+    def generate(self, rows):
+        # '!' is an unusable password hash, the user only owns the generated rows
+        user = User.objects.create(username=f'serialization-benchmark-{time.time_ns()}', password='!')
+        account = InvestmentAccount.objects.create(name='Serialization benchmark')
+        rng = random.Random(0)
+        now = timezone.now()
+        # bulk_create skips the balance signals, fine for rows that are rolled back
+        Transaction.objects.bulk_create([
+            Transaction(
+                account=account, user=user,
+                amount=Decimal(rng.randint(-100000, 100000)) / 100,
+                created_at=now - timedelta(microseconds=rng.randint(0, 10 ** 13)),
+            )
+            for _ in range(rows)
+        ], batch_size=5000)
+        return account.pk
+
+    def best_of(self, repeat, encode):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = encode()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings), output
@@ -0,0 +1,120 @@
+from datetime import timedelta
+from decimal import Decimal
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api import ledger
+from api.balances import rebuild_balances, rebuild_daily_balances
+from api.models import InvestmentAccount, Transaction, UserAccountPermission
+from api.permission_cache import permission_cache
+from api.response_cache import bump_all
+
+# Share of generated grants per permission level
+PERMISSION_WEIGHTS = {
+    UserAccountPermission.VIEW_ONLY: 4,
+    UserAccountPermission.CRUD: 4,
+    UserAccountPermission.POST_ONLY: 2,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset of users, accounts, permissions and transactions with bulk "
+        "inserts, then rebuild the balances and daily rollups and seed the ledger. Usernames and account names are "
+        "prefixed so a dataset can sit next to real data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--accounts', type=int, default=50)
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--accounts-per-user', type=int, default=5,
+                            help="Number of accounts each user is granted a permission on.")
+        parser.add_argument('--days', type=int, default=365,
+                            help="Transactions are spread over this many days up to now.")
+        parser.add_argument('--prefix', default='bench',
+                            help="Prefix for generated usernames and account names.")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['accounts'] < 1:
+            raise CommandError("At least one user and one account are needed.")
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            usernames = [f'{prefix}_user_{i}' for i in range(options['users'])]
+            User.objects.bulk_create(
+                # '!' is an unusable password hash; benchmarks log in with force_login
+                [User(username=username, password='!') for username in usernames],
+                batch_size=options['batch_size'],
+                ignore_conflicts=True,
+            )
+            # Users left by an earlier run with the same prefix are reused
+            existing = {user.username: user for user in User.objects.filter(username__startswith=f'{prefix}_user_')}
+            users = [existing[username] for username in usernames]
+            if not User.objects.filter(username=f'{prefix}_admin').exists():
+                User.objects.create_superuser(username=f'{prefix}_admin', password=None)
+            accounts = InvestmentAccount.objects.bulk_create(
+                [InvestmentAccount(name=f'{prefix} account {i}') for i in range(options['accounts'])],
+                batch_size=options['batch_size'],
+            )
+            grants = self.generate_permissions(rng, users, accounts, options['accounts_per_user'])
+            UserAccountPermission.objects.bulk_create(grants, batch_size=options['batch_size'])
+        # bulk_create skips the signals that keep cached permission maps in step
+        for user in users:
+            permission_cache.invalidate(user.pk)
+        self.stdout.write(f"Created {len(users)} users, {len(accounts)} accounts and {len(grants)} permissions.")
+
+        # Transactions are posted by users holding a permission on the account, where there is one
+        posters = {account.pk: [] for account in accounts}
+        for grant in grants:
+            posters[grant.account_id].append(grant.user_id)
+        user_ids = [user.pk for user in users]
+        account_ids = [account.pk for account in accounts]
+
+        now = timezone.now()
+        span = options['days'] * 24 * 60 * 60
+        remaining = options['transactions']
+        created = 0
+        while remaining > 0:
+            size = min(remaining, options['batch_size'])
+            batch = []
+            for _ in range(size):
+                account_id = rng.choice(account_ids)
+                batch.append(Transaction(
+                    account_id=account_id,
+                    user_id=rng.choice(posters[account_id] or user_ids),
+                    amount=Decimal(rng.randint(-100000, 100000)) / 100,
+                    created_at=now - timedelta(seconds=rng.randint(0, span)),
+                ))
+            with transaction.atomic():
+                Transaction.objects.bulk_create(batch)
+            created += size
+            remaining -= size
+            self.stdout.write(f"Inserted {created}/{options['transactions']} transactions")
+
+        with transaction.atomic():
+            rebuild_balances(account_ids)
+            rebuild_daily_balances(account_ids)
+            ledger.seed(account_ids)
+        # Everything above went in through bulk_create, which sends no signals
+        bump_all()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Generated dataset '{prefix}' in {elapsed:.1f}s."))
+
+    def generate_permissions(self, rng, users, accounts, per_user):
+        levels = list(PERMISSION_WEIGHTS)
+        weights = list(PERMISSION_WEIGHTS.values())
+        grants = []
+        for user in users:
+            for account in rng.sample(accounts, min(per_user, len(accounts))):
+                permission = rng.choices(levels, weights)[0]
+                grants.append(UserAccountPermission(user=user, account=account, permission=permission))
+        return grants
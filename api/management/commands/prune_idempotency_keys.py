@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.idempotency import prune_expired
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys whose replay window has expired."
+
+    def handle(self, *args, **options):
+        deleted = prune_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency key(s)."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.balances import rebuild_balances
+from api.response_cache import bump_accounts
+
+
+class Command(BaseCommand):
+    help = "Reconcile the materialized account balances against the transaction table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help="Only reconcile this account id (may be repeated).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report drifted balances without fixing them.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = rebuild_balances(options['accounts'], dry_run=options['dry_run'])
+        if not options['dry_run']:
+            bump_accounts(account_id for account_id, _, _ in mismatches)
+
+        for account_id, stored, actual in mismatches:
+            self.stdout.write(f"Account {account_id}: stored {stored:.2f}, actual {actual:.2f}")
+
+        verb = "Found" if options['dry_run'] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(mismatches)} drifted balance(s)."))
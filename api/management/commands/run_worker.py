@@ -0,0 +1,57 @@
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from api import jobs
+
+
+def _work_process(poll_interval, burst):
+    # Started with spawn on platforms without fork, where Django has to be set up again
+    import django
+    django.setup()
+    jobs.work(poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (reports, balance and projection rebuilds) in a pool of "
+        "worker processes, so web workers stay free for interactive requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            help="Worker processes (default JOB_WORKER_PROCESSES); 1 runs jobs in this process.")
+        parser.add_argument('--poll-interval', type=float,
+                            help="Seconds to wait before checking an empty queue again (default JOB_POLL_INTERVAL).")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the queue is empty instead of waiting for new jobs.")
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or getattr(settings, 'JOB_WORKER_PROCESSES', 2)
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+
+        if processes == 1:
+            done = jobs.work(poll_interval=options['poll_interval'], burst=options['burst'])
+            self.stdout.write(self.style.SUCCESS(f"Ran {done} job(s)."))
+            return
+
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        pool = [
+            multiprocessing.Process(target=_work_process, args=(options['poll_interval'], options['burst']),
+                                    name=f'job-worker-{i}')
+            for i in range(processes)
+        ]
+        for process in pool:
+            process.start()
+        self.stdout.write(f"Started {processes} worker process(es).")
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            for process in pool:
+                process.terminate()
+            for process in pool:
+                process.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
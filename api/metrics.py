@@ -0,0 +1,148 @@
+from bisect import bisect_left
+from threading import Lock
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f'{self.name}{format_labels(self.labels, label_values)} {format_number(value)}'
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Counter):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then the sum and the total count
+                series = self._values[label_values] = [[0] * len(self.buckets), 0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._values.items()}
+        for label_values, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labels, label_values, [('le', format_number(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labels, label_values, [('le', '+Inf')])
+            yield f'{self.name}_bucket{labels} {count}'
+            labels = format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {format_number(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+ENDPOINT_LABELS = ('endpoint', 'method')
+requests_total = registry.register(Counter(
+    'api_requests_total', 'Requests handled, by resolved endpoint and status.', ('endpoint', 'method', 'status')))
+request_duration = registry.register(Histogram(
+    'api_request_duration_seconds', 'Total time spent handling the request.', ENDPOINT_LABELS))
+db_queries = registry.register(Histogram(
+    'api_request_db_queries', 'Database queries executed per request.', ENDPOINT_LABELS, QUERY_BUCKETS))
+db_duration = registry.register(Histogram(
+    'api_request_db_duration_seconds', 'Time spent in database queries per request.', ENDPOINT_LABELS))
+view_duration = registry.register(Histogram(
+    'api_request_view_duration_seconds', 'Time spent in the view outside database queries.', ENDPOINT_LABELS))
+serialize_duration = registry.register(Histogram(
+    'api_request_serialize_duration_seconds', 'Time spent in the view formatting transactions for the response.',
+    ENDPOINT_LABELS))
+render_duration = registry.register(Histogram(
+    'api_request_render_duration_seconds', 'Time spent rendering the response body.', ENDPOINT_LABELS))
+write_queue_batch_size = registry.register(Histogram(
+    'api_write_queue_batch_size', 'Writes group-committed per SQLite writer queue transaction.', (), BATCH_BUCKETS))
+
+
+def record(endpoint, method, status, total, queries, db_time, view_time, render_time, serialize_time=None):
+    labels = (endpoint, method)
+    requests_total.inc(endpoint, method, str(status))
+    request_duration.observe(total, *labels)
+    db_queries.observe(queries, *labels)
+    db_duration.observe(db_time, *labels)
+    if view_time is not None:
+        view_duration.observe(view_time, *labels)
+    if serialize_time is not None:
+        serialize_duration.observe(serialize_time, *labels)
+    if render_time is not None:
+        render_duration.observe(render_time, *labels)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of the in-process metrics, for staff or METRICS_ALLOWED_IPS."""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in allowed_ips):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,219 @@
+import cProfile
+from contextlib import ExitStack, contextmanager
+import io
+import pstats
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from . import metrics
+from .routers import read_alias
+
+PROFILE_HEADER = 'X-Profile'
+
+
+class QueryTimer:
+    """Database execute wrapper that counts queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = QueryTimer()
+        self.view_started = None
+        self.view_db_started = 0.0
+        self.view_time = None
+        self.render_started = None
+        self.render_time = None
+        self.serialize_time = None
+
+
+@contextmanager
+def timed_serialization(request):
+    """Count the time spent in the block, less its queries, as the request's serialization time."""
+    timings = getattr(request, '_timings', None)
+    if timings is None:
+        yield
+        return
+    started, db_started = time.perf_counter(), timings.queries.duration
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (timings.queries.duration - db_started)
+        timings.serialize_time = (timings.serialize_time or 0.0) + elapsed
+
+
+class RequestMetricsMiddleware:
+    """
+    Record per-endpoint latency, query count, database time, view time and
+    response rendering time into the histograms in api.metrics. Views time
+    their formatting of rows with timed_serialization(); it is part of the
+    view time as well.
+
+    Endpoints are labelled with the resolved URL name, e.g. ``transaction-list``.
+    Staff users can send an ``X-Profile`` header (``cprofile`` or
+    ``pyinstrument``) to get a profile of the request back instead of the
+    response, when API_PROFILING_ENABLED is on.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._timings = timings = RequestTimings()
+        if self.profiling_requested(request):
+            return self.profile(request)
+        with self.timed_queries(timings):
+            response = self.get_response(request)
+        self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        request._timings = timings = RequestTimings()
+        # Connections are per thread and the async ORM queries from the request's thread-sensitive
+        # worker, so the wrappers are installed and removed on that thread rather than the event loop's
+        queries = await sync_to_async(self.timed_queries)(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.close)()
+        self.record(request, response, timings)
+        return response
+
+    def timed_queries(self, timings):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings.queries))
+        return stack
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, '_timings', None)
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+            timings.view_db_started = timings.queries.duration
+
+    def process_template_response(self, request, response):
+        # Called once the view has returned a response that still has to be rendered (DRF Responses)
+        timings = getattr(request, '_timings', None)
+        if timings is not None:
+            self.end_view(timings)
+            timings.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.end_render(timings))
+        return response
+
+    def end_view(self, timings):
+        if timings.view_started is not None and timings.view_time is None:
+            elapsed = time.perf_counter() - timings.view_started
+            timings.view_time = elapsed - (timings.queries.duration - timings.view_db_started)
+
+    def end_render(self, timings):
+        timings.render_time = time.perf_counter() - timings.render_started
+
+    def record(self, request, response, timings):
+        self.end_view(timings)
+        match = request.resolver_match
+        endpoint = (match.url_name or match.view_name) if match else 'unmatched'
+        metrics.record(
+            endpoint, request.method, response.status_code,
+            total=time.perf_counter() - timings.started,
+            queries=timings.queries.count,
+            db_time=timings.queries.duration,
+            view_time=timings.view_time,
+            render_time=timings.render_time,
+            serialize_time=timings.serialize_time,
+        )
+
+    def profiling_requested(self, request):
+        if PROFILE_HEADER not in request.headers or not getattr(settings, 'API_PROFILING_ENABLED', False):
+            return False
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+
+    def profile(self, request):
+        if request.headers[PROFILE_HEADER].lower() == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                pass
+            else:
+                profiler = Profiler()
+                profiler.start()
+                self.get_response(request)
+                profiler.stop()
+                return HttpResponse(profiler.output_text(unicode=True), content_type='text/plain; charset=utf-8')
+
+        profiler = cProfile.Profile()
+        profiler.runcall(self.get_response, request)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(50)
+        return HttpResponse(output.getvalue(), content_type='text/plain; charset=utf-8')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Send the reads of read-only API views to the ``DATABASE_REPLICA_ALIAS``
+    database.
+
+    A view qualifies when the request method is safe and its viewset action
+    is in ``REPLICA_READ_ACTIONS``. Authentication and everything else stay on
+    the primary. The middleware removes itself when no replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', 'replica')
+        if self.alias not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.actions = set(getattr(settings, 'REPLICA_READ_ACTIONS', ['list', 'retrieve', 'analytics']))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_alias.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+    async def __acall__(self, request):
+        token = read_alias.set(None)
+        try:
+            return await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return
+        # DRF viewsets expose their method -> action mapping on the view function; HEAD runs the GET action
+        actions = getattr(view_func, 'actions', None) or {}
+        if actions.get('get') in self.actions:
+            # DRF authenticates lazily inside the view; resolve the session user on the primary first
+            user = getattr(request, 'user', None)
+            if user is not None:
+                user.is_authenticated
+            read_alias.set(self.alias)
@@ -1,11 +1,18 @@
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 class InvestmentAccount(models.Model):
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(default=timezone.now) 
     users = models.ManyToManyField(User, through='UserAccountPermission')
+    # Running total of the account's transactions, maintained by api.balances
+    balance = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # Bumped on every update through the API, for If-Match/ETag optimistic concurrency
+    version = models.PositiveIntegerField(default=1)
+    # Sequence number of the account's last LedgerEvent
+    ledger_sequence = models.PositiveBigIntegerField(default=0)
 
 class UserAccountPermission(models.Model):
     VIEW_ONLY = 'view'
@@ -26,7 +33,167 @@ class UserAccountPermission(models.Model):
         unique_together = ['user', 'account']
 
 class Transaction(models.Model):
-    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, related_name='transactions')
+    # The composite indexes below lead with account, so the FK index would be redundant
+    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, related_name='transactions', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(default=timezone.now)
+    # Bumped on every update through the API, for If-Match/ETag optimistic concurrency
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # account_id lookups, account_id__in lists and created_at ranges per account
+            models.Index(fields=['account', 'created_at'], name='txn_account_created_idx'),
+            # admin_transactions filtered by user, optionally with a date range
+            models.Index(fields=['account', 'user', 'created_at'], name='txn_account_user_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so the ledger can record a delta on save
+        instance._stored = (
+            instance.__dict__.get('account_id'),
+            instance.__dict__.get('amount'),
+            instance.__dict__.get('created_at'),
+            instance.__dict__.get('user_id'),
+        )
+        return instance
+
+class ArchivedTransaction(models.Model):
+    """
+    Transaction moved out of the hot table by the archive_transactions command.
+
+    Rows keep their id, so hot and archived rows page together on (created_at, id).
+    Their amounts stay in the account balance and the daily rollup until their user is deleted.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, related_name='archived_transactions', db_index=False)
+    # Plain id like LedgerEvent.user_id; a user's archived rows are reversed by a User pre_delete signal
+    user_id = models.IntegerField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'created_at'], name='archive_account_created_idx'),
+            models.Index(fields=['account', 'user_id', 'created_at'], name='archive_acct_user_created_idx'),
+        ]
+
+class LedgerEvent(models.Model):
+    """
+    Append-only record of a change to an account's transactions, written by api.ledger.
+
+    Events are numbered per account without gaps; projections replay them in that order.
+    """
+    CREATE = 'create'
+    ADJUST = 'adjust'
+    REVERSE = 'reverse'
+
+    KIND_CHOICES = [
+        (CREATE, 'Create'),
+        (ADJUST, 'Adjust'),
+        (REVERSE, 'Reverse'),
+    ]
+
+    # The unique constraint below leads with account, so the FK index would be redundant
+    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, related_name='ledger_events', db_index=False)
+    sequence = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Not a foreign key: the event outlives the transaction's deletion or archiving
+    transaction_id = models.BigIntegerField()
+    # Not a foreign key either: deleting a user must not rewrite the ledger
+    user_id = models.IntegerField()
+    # Signed change to the account balance
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # The transaction's created_at, which places the change in the daily rollup
+    created_at = models.DateTimeField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['account', 'sequence']
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger events are append-only.")
+        super().save(*args, **kwargs)
+
+class UserBalance(models.Model):
+    """Per-account, per-user total of transaction amounts, projected from the ledger by api.ledger."""
+    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, related_name='user_balances')
+    # Plain id like LedgerEvent.user_id: the reverse events of a deleted user's transactions still land here
+    user_id = models.IntegerField()
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['account', 'user_id']
+
+class ProjectionCheckpoint(models.Model):
+    """Sequence number of the last ledger event a projection has applied for an account."""
+    projection = models.CharField(max_length=50)
+    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE)
+    sequence = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['projection', 'account']
+
+class DailyBalance(models.Model):
+    """Per-account, per-day rollup of transaction amounts, maintained by api.balances."""
+    account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, related_name='daily_balances')
+    date = models.DateField()
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['account', 'date']
+
+class IdempotencyKey(models.Model):
+    """Stored response of a POST made with an Idempotency-Key header, replayed on retries until it expires."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+
+class Job(models.Model):
+    """Background task queued by api.jobs and run by the run_worker command."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    # Who asked for it; only they (and superusers) can see the job and its result
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    result = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    # Name of the result file under JOB_RESULT_DIR, if the job wrote one
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
@@ -0,0 +1,165 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import heapq
+from itertools import islice
+import json
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination over ``(created_at, id)``, newest first.
+
+    Each page is a single indexed range query, so the cost of a page does not
+    depend on how deep the client has paged. Cursors are opaque tokens that
+    encode the position of the last row of the previous page.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_queryset(self, queryset, request):
+        """Return the query for the requested page, fetching one extra row to detect a next page."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = self.order(queryset)
+        if position is not None:
+            queryset = self.after(queryset, position)
+        return queryset[:self.page_size + 1]
+
+    def order(self, queryset):
+        return queryset.order_by('-created_at', '-id')
+
+    def after(self, queryset, position):
+        created_at, pk = position
+        # Equivalent to (created_at, id) < position, written so the created_at index range applies
+        return queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+
+    def finish_page(self, page):
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.get_page_queryset(queryset, request)))
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate several querysets as one, such as hot and archived transactions.
+
+        Each contributes at most one page, merged on (created_at, id); their ids must not overlap.
+        """
+        pages = [list(self.get_page_queryset(queryset, request)) for queryset in querysets]
+        merged = heapq.merge(*pages, key=self.get_position, reverse=True)
+        return self.finish_page(list(islice(merged, self.page_size + 1)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """Async variant of paginate_queryset for views running on the ASGI event loop."""
+        return self.finish_page([item async for item in self.get_page_queryset(queryset, request)])
+
+    def get_query_params(self, request):
+        # DRF requests expose query_params, plain Django requests (the async views) only GET
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(self.get_query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return item['created_at'], item['id']
+        if isinstance(item, tuple):
+            # values_list(named=True) rows
+            return item.created_at, item.id
+        return item.created_at, item.pk
+
+    def dump_position(self, position):
+        created_at, pk = position
+        return [created_at.isoformat(), pk]
+
+    def load_position(self, values):
+        """Inverse of dump_position(); raises TypeError or ValueError for a malformed cursor."""
+        created_at, pk = values
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(values)
+        return created_at, int(pk)
+
+    def encode_cursor(self, position):
+        payload = json.dumps(self.dump_position(position), separators=(',', ':')).encode()
+        return urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = self.get_query_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return self.load_position(json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+
+class PermissionPagination(KeysetPagination):
+    """
+    Forward-only keyset pagination of UserAccountPermission rows over ``(user_id, account_id)``.
+
+    Pages walk the unique (user, account) index, so listing the whole matrix
+    never sorts or skips over earlier rows.
+    """
+
+    def order(self, queryset):
+        return queryset.order_by('user_id', 'account_id')
+
+    def after(self, queryset, position):
+        user_id, account_id = position
+        # Equivalent to (user_id, account_id) > position, written so the index range on user applies
+        return queryset.filter(user_id__gte=user_id).exclude(user_id=user_id, account_id__lte=account_id)
+
+    def get_position(self, item):
+        return item.user_id, item.account_id
+
+    def dump_position(self, position):
+        return list(position)
+
+    def load_position(self, values):
+        user_id, account_id = values
+        return int(user_id), int(account_id)
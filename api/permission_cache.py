@@ -0,0 +1,142 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.db.models import Q
+from .models import UserAccountPermission
+from .versions import bump_versions, get_versions
+
+DEFAULT_TTL = 30
+DEFAULT_SIZE = 10000
+DEFAULT_MAX_FILTER_IDS = 10000
+
+# Permission levels that let a user list and read an account and its transactions
+LIST_PERMISSIONS = (UserAccountPermission.VIEW_ONLY, UserAccountPermission.CRUD)
+
+Entry = namedtuple('Entry', ['expires', 'version', 'permissions', 'listable'])
+
+
+class AccountPermissionCache:
+    """
+    Process-level LRU of each user's ``{account_id: permission}`` map and the
+    precomputed tuple of account ids they can list (VIEW_ONLY or CRUD).
+
+    Entries are stamped with a per-user version kept in the
+    ``ACCOUNT_PERMISSION_CACHE_ALIAS`` Django cache. Saving or deleting one of
+    the user's UserAccountPermission rows bumps the version, so with a shared
+    cache backend every process reloads on its next request; with a
+    per-process backend other processes see the change once their entry
+    expires after ``ACCOUNT_PERMISSION_CACHE_TTL`` seconds.
+    A TTL of 0 disables the process cache; maps are then loaded once per request.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'ACCOUNT_PERMISSION_CACHE_TTL', DEFAULT_TTL)
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'ACCOUNT_PERMISSION_CACHE_SIZE', DEFAULT_SIZE)
+
+    @property
+    def versions(self):
+        return caches[getattr(settings, 'ACCOUNT_PERMISSION_CACHE_ALIAS', 'default')]
+
+    def version_key(self, user_id):
+        return f'account-permissions:version:{user_id}'
+
+    def version(self, user_id):
+        version, = get_versions(self.versions, [self.version_key(user_id)])
+        return version
+
+    def load(self, user_id, version=None):
+        # Always from the primary: a map read from a lagging replica would be cached for writes too
+        rows = UserAccountPermission.objects.db_manager(router.db_for_write(UserAccountPermission))
+        permissions = dict(rows.filter(user_id=user_id).values_list('account_id', 'permission'))
+        listable = tuple(sorted(account_id for account_id, permission in permissions.items()
+                                if permission in LIST_PERMISSIONS))
+        return Entry(None, version, permissions, listable)
+
+    def get_entry(self, user_id):
+        ttl = self.ttl
+        if ttl <= 0:
+            return self.load(user_id)
+
+        # Read the version before loading, so an invalidation racing the load leaves a stale stamp
+        version = self.version(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.expires > now and entry.version == version:
+                self._entries.move_to_end(user_id)
+                return entry
+
+        entry = self.load(user_id, version)._replace(expires=now + ttl)
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get(self, user_id):
+        return self.get_entry(user_id).permissions
+
+    def get_listable(self, user_id):
+        return self.get_entry(user_id).listable
+
+    def invalidate(self, user_id):
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids):
+        user_ids = set(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        bump_versions(self.versions, [self.version_key(user_id) for user_id in user_ids])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+permission_cache = AccountPermissionCache()
+
+
+def get_account_entry(request):
+    """Return the user's cache entry, resolved at most once per request."""
+    entry = getattr(request, '_account_entry', None)
+    if entry is None:
+        entry = permission_cache.get_entry(request.user.pk)
+        request._account_entry = entry
+    return entry
+
+
+def get_account_permissions(request):
+    """Return the user's ``{account_id: permission}`` map, resolved at most once per request."""
+    return get_account_entry(request).permissions
+
+
+def get_account_permission(request, account_id):
+    """Return the user's permission on ``account_id``, or None."""
+    return get_account_permissions(request).get(account_id)
+
+
+def listable_accounts(request, lookup='account_id'):
+    """
+    Return a Q limiting ``lookup`` to the accounts the user can list.
+
+    The ids come from the cached set; past ``ACCOUNT_FILTER_MAX_IDS`` they are
+    left to the database as a subquery instead of one bound parameter each.
+    """
+    account_ids = get_account_entry(request).listable
+    if len(account_ids) > getattr(settings, 'ACCOUNT_FILTER_MAX_IDS', DEFAULT_MAX_FILTER_IDS):
+        account_ids = UserAccountPermission.objects.filter(
+            user_id=request.user.pk, permission__in=LIST_PERMISSIONS).values('account_id')
+    return Q(**{f'{lookup}__in': account_ids})
@@ -1,5 +1,6 @@
 from rest_framework import permissions
-from .models import UserAccountPermission
+from .models import Transaction, UserAccountPermission
+from .permission_cache import LIST_PERMISSIONS, get_account_permission
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,7 +8,7 @@ logger = logging.getLogger(__name__)
 class AccountPermission(permissions.BasePermission):
     def has_permission(self, request, view):
         user = request.user
-        logger.debug(f"Checking permission for user: {user}")
+        logger.debug("Checking permission for user: %s", user)
 
         if not user.is_authenticated:
             logger.debug("User is not authenticated")
@@ -17,13 +18,24 @@ class AccountPermission(permissions.BasePermission):
             # Allow list action, but filter results in get_queryset
             return True
 
+        if view.action == 'bulk_create':
+            # Every row names its own account, so the view checks them against the permission map
+            return True
+
         # For create action, we need to check the account from the request data
         if view.action == 'create':
             account_id = request.data.get('account')
+        elif issubclass(view.queryset.model, Transaction):
+            # The pk names a transaction, its account is checked once the object is loaded
+            return True
         else:
             account_id = view.kwargs.get('pk')
 
-        logger.debug(f"Account ID from request: {account_id}")
+        return self.has_account_permission(request, view, account_id)
+
+    def has_account_permission(self, request, view, account_id):
+        user = request.user
+        logger.debug("Account ID from request: %s", account_id)
 
         if not account_id:
             logger.debug("No account ID found in request")
@@ -35,25 +47,35 @@ class AccountPermission(permissions.BasePermission):
             logger.debug("Invalid account ID")
             return False
 
-        permission = UserAccountPermission.objects.filter(user=user, account_id=account_id).first()
-        logger.debug(f"User: {user}, Account: {account_id}, Permission: {permission.permission if permission else 'None'}")
+        # Resolved from the user's cached permission map, so repeated checks cost no queries
+        permission = get_account_permission(request, account_id)
+        logger.debug("User: %s, Account: %s, Permission: %s", user, account_id, permission)
 
         if not permission:
             logger.debug("No permission found for user and account")
             return False
 
         if view.action in ['retrieve', 'list']:
-            allowed = permission.permission in [UserAccountPermission.VIEW_ONLY, UserAccountPermission.CRUD]
+            allowed = permission in LIST_PERMISSIONS
         elif view.action == 'create':
-            allowed = permission.permission in [UserAccountPermission.POST_ONLY, UserAccountPermission.CRUD]
+            allowed = permission in [UserAccountPermission.POST_ONLY, UserAccountPermission.CRUD]
         elif view.action in ['update', 'partial_update', 'destroy']:
-            allowed = permission.permission == UserAccountPermission.CRUD
+            allowed = permission == UserAccountPermission.CRUD
         else:
             allowed = False
 
-        logger.debug(f"Permission check result for action {view.action}: {allowed}")
+        logger.debug(
+            "Permission check result for action %s: %s", view.action, allowed,
+            extra={'user_id': user.pk, 'account_id': account_id, 'action': view.action, 'allowed': allowed},
+        )
         return allowed
 
     def has_object_permission(self, request, view, obj):
-        # This method is called for object-level permissions
-        return self.has_permission(request, view)
\ No newline at end of file
+        # Transactions are checked against their account, accounts against themselves
+        if not isinstance(obj, Transaction):
+            return self.has_account_permission(request, view, obj.pk)
+        if not self.has_account_permission(request, view, obj.account_id):
+            return False
+        # Moving a transaction needs the same permission on the account it moves to
+        target = request.data.get('account') if view.action in ('update', 'partial_update') else None
+        return target in (None, obj.account_id, str(obj.account_id)) or self.has_account_permission(request, view, target)
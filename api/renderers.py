@@ -0,0 +1,48 @@
+import json
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output is byte-for-byte what JSONRenderer produces for compact
+    responses; indented output (``Accept: application/json; indent=4``) and
+    installs without orjson fall back to JSONRenderer itself.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Datetimes and anything orjson does not know (Decimal, lazy strings, ...) go through DRF's encoder
+        ret = orjson.dumps(data, default=JSONEncoder().default,
+                           option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # Same escaping as JSONRenderer, these are valid JSON but break JavaScript string literals
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Newline-delimited JSON. Streaming views write their own body, so this only
+    renders the error responses DRF produces for them.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data).encode() + b'\n'
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
@@ -0,0 +1,46 @@
+from datetime import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .archive import needs_archive
+from .models import ArchivedTransaction, Transaction
+
+
+def filter_transactions(params, account_id, model=Transaction):
+    """
+    Apply the user_id/start_date/end_date filters shared by the admin reads and report jobs.
+
+    ``params`` is the request's query parameters or a job's params. Returns
+    the filtered queryset of ``model`` (Transaction or ArchivedTransaction)
+    and the ``(start, end)`` datetimes of the date range, or ``None`` when no
+    valid range was given.
+    """
+    user_id = params.get('user_id')
+
+    # Filter transactions based on user_id and account_id
+    transactions = model.objects.filter(account_id=account_id)
+
+    if user_id:
+        transactions = transactions.filter(user_id=user_id)
+
+    # Filter transactions by date range if provided
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+
+    if start_date and end_date:
+        start_date = parse_date(start_date)
+        end_date = parse_date(end_date)
+        if start_date and end_date:
+            start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+            end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
+            transactions = transactions.filter(created_at__range=[start_datetime, end_datetime])
+            return transactions, (start_datetime, end_datetime)
+
+    return transactions, None
+
+
+def filter_archived(params, account_id, date_range):
+    """The archived counterpart of filter_transactions(), or None when the range does not reach the archive."""
+    if not needs_archive(account_id, date_range[0] if date_range else None):
+        return None
+    archived, _ = filter_transactions(params, account_id, ArchivedTransaction)
+    return archived
@@ -0,0 +1,159 @@
+from functools import wraps
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from .permission_cache import get_account_entry, permission_cache
+from .routers import read_alias, reading_from
+from . import versions
+
+CACHE_HEADER = 'X-Cache'
+
+# Bumped by maintenance commands that rewrite data behind the signals' back
+EPOCH_KEY = 'response-version:epoch'
+# Bumped when any account is created, renamed or deleted
+ACCOUNTS_KEY = 'response-version:accounts'
+# Bumped with every account's version; stands in for them when a list spans too many accounts
+TRANSACTIONS_KEY = 'response-version:transactions'
+
+# Transaction lists over more accounts than this depend on TRANSACTIONS_KEY instead of one key per account
+DEFAULT_MAX_ACCOUNT_KEYS = 100
+
+
+def account_key(account_id):
+    return f'response-version:account:{account_id}'
+
+
+def changed_key(key):
+    # Present for DATABASE_REPLICA_MAX_LAG seconds after the counter was bumped
+    return f'{key}:changed'
+
+
+def get_version_cache():
+    return caches[getattr(settings, 'RESPONSE_VERSION_CACHE_ALIAS', 'default')]
+
+
+def get_response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_versions(keys):
+    """Return the current value of each version counter, creating missing ones."""
+    return versions.get_versions(get_version_cache(), keys)
+
+
+def bump(keys):
+    cache = get_version_cache()
+    versions.bump_versions(cache, keys)
+    lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 0)
+    if lag:
+        cache.set_many({changed_key(key): True for key in keys}, lag)
+
+
+def changed_recently(keys):
+    """True when one of the counters was bumped within DATABASE_REPLICA_MAX_LAG seconds."""
+    if not getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 0):
+        return False
+    return bool(get_version_cache().get_many([changed_key(key) for key in keys]))
+
+
+def bump_accounts(account_ids, accounts=False):
+    """Invalidate cached reads of these accounts, and of account lists when ``accounts`` is set."""
+    keys = [account_key(account_id) for account_id in set(account_ids)]
+    if keys:
+        keys.append(TRANSACTIONS_KEY)
+    if accounts:
+        keys.append(ACCOUNTS_KEY)
+    bump(keys)
+    # Again on commit, so a read that ran between the write and the commit is not cached as current
+    transaction.on_commit(lambda: bump(keys))
+
+
+def bump_all():
+    bump([EPOCH_KEY])
+
+
+def user_version(request):
+    # Bumped whenever one of the user's permissions changes
+    return permission_cache.version(request.user.pk)
+
+
+def account_list_keys(request, **kwargs):
+    return [EPOCH_KEY, ACCOUNTS_KEY]
+
+
+def account_keys(request, pk=None, **kwargs):
+    return [EPOCH_KEY, account_key(pk)]
+
+
+def transaction_list_keys(request, **kwargs):
+    account_ids = get_account_entry(request).listable
+    if len(account_ids) > getattr(settings, 'RESPONSE_CACHE_MAX_ACCOUNT_KEYS', DEFAULT_MAX_ACCOUNT_KEYS):
+        # Reading thousands of counters would cost more than the cached body saves; such
+        # lists are invalidated by a write to any account instead
+        return [EPOCH_KEY, TRANSACTIONS_KEY]
+    return [EPOCH_KEY, *map(account_key, account_ids)]
+
+
+def make_etag(request, versions):
+    payload = json.dumps([
+        request.build_absolute_uri(),
+        request.accepted_renderer.format,
+        request.user.pk,
+        versions,
+    ], default=str)
+    return '"%s"' % hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def cached_response(get_keys_for):
+    """
+    Serve a read handler through strong ETags and the response cache.
+
+    ``get_keys_for(request, **kwargs)`` returns the keys of the version
+    counters the response depends on. Their values, the user's permission
+    version, the URL, the negotiated format and the user make the ETag, so a
+    request whose If-None-Match still matches gets a 304, and any other
+    request for the same ETag gets the cached data from
+    ``RESPONSE_CACHE_ALIAS``. Either way the queryset and serializer do not
+    run. Only 200 responses are cached, for ``RESPONSE_CACHE_TIMEOUT`` seconds.
+
+    A read routed to the replica runs on the primary instead when one of the
+    counters was bumped within ``DATABASE_REPLICA_MAX_LAG`` seconds, since the
+    replica may not have the write yet.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            # Versions are read before the handler runs, so a write racing it can only
+            # leave newer data under an older ETag, never older data under a newer one
+            keys = get_keys_for(request, **kwargs)
+            etag = make_etag(request, [user_version(request), *get_versions(keys)])
+            if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                cache = get_response_cache()
+                key = f'response:{etag}'
+                data = cache.get(key)
+                if data is not None:
+                    response = Response(data, headers={CACHE_HEADER: 'hit'})
+                else:
+                    if read_alias.get() is not None and changed_recently(keys):
+                        with reading_from(None):
+                            response = view_method(self, request, *args, **kwargs)
+                    else:
+                        response = view_method(self, request, *args, **kwargs)
+                    if response.status_code == status.HTTP_200_OK:
+                        cache.set(key, response.data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+                        response[CACHE_HEADER] = 'miss'
+            if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+            return response
+        return wrapper
+    return decorator
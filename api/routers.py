@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Alias reads go to for the current request, or None for the default database
+read_alias = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Send ORM reads inside the block to ``alias``; writes always go to the primary."""
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Route reads to the replica chosen by ReplicaRoutingMiddleware and
+    everything else to the primary.
+
+    Only read-only views are routed, so a request never reads from a replica
+    what it has just written to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
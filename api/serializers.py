@@ -1,5 +1,8 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import InvestmentAccount, Transaction, UserAccountPermission
+from .ledger import PROJECTIONS
+from .models import InvestmentAccount, Job, Transaction, UserAccountPermission
+from .tasks import REPORT_FORMATS
 
 class InvestmentAccountSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,3 +21,51 @@ class UserAccountPermissionSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserAccountPermission
         fields = ['user', 'account', 'permission']
+
+class PermissionChangeSerializer(serializers.Serializer):
+    """Validates one row of a bulk permission change; a null permission revokes the user's access."""
+    user = serializers.IntegerField(min_value=1)
+    account = serializers.IntegerField(min_value=1)
+    permission = serializers.ChoiceField(choices=UserAccountPermission.PERMISSION_CHOICES, allow_null=True)
+
+class BulkTransactionSerializer(serializers.Serializer):
+    """Validates one row of a bulk upload; the account is checked against the caller's permission map."""
+    account = serializers.IntegerField(min_value=1)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class JobSerializer(serializers.ModelSerializer):
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'params', 'status', 'result', 'result_url', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['status', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+
+    def get_result_url(self, job):
+        if job.status != Job.DONE or not job.result_file:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('job-result', args=[job.pk]))
+
+class AccountsJobParamsSerializer(serializers.Serializer):
+    """Params of the rebuild_balances and rebuild_daily_balances jobs; all accounts when omitted."""
+    accounts = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+class RebuildProjectionsParamsSerializer(AccountsJobParamsSerializer):
+    projections = serializers.ListField(child=serializers.ChoiceField(choices=sorted(PROJECTIONS)), required=False)
+
+class ReportParamsSerializer(serializers.Serializer):
+    """Params of a report job, checked before it is queued so a bad request fails with 400, not in the worker."""
+    account = serializers.IntegerField(min_value=1)
+    format = serializers.ChoiceField(choices=REPORT_FORMATS, default='csv')
+    user_id = serializers.IntegerField(min_value=1, required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+# Validates the params of each job kind in api.jobs.HANDLERS
+JOB_PARAMS_SERIALIZERS = {
+    'report': ReportParamsSerializer,
+    'rebuild_balances': AccountsJobParamsSerializer,
+    'rebuild_daily_balances': AccountsJobParamsSerializer,
+    'rebuild_projections': RebuildProjectionsParamsSerializer,
+}
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import ledger, response_cache
+from .archive import archiving
+from .grants import applying as applying_permission_changes
+from .models import ArchivedTransaction, InvestmentAccount, Transaction, UserAccountPermission
+from .permission_cache import permission_cache
+
+
+def _deleting_account(origin):
+    """Return True when a delete cascades from an InvestmentAccount, whose rollups go with it."""
+    if isinstance(origin, QuerySet):
+        return origin.model is InvestmentAccount
+    return isinstance(origin, InvestmentAccount)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_post_save(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored', None)
+    ledger.record_saved(instance, created)
+    response_cache.bump_accounts({instance.account_id, stored[0]} if stored else {instance.account_id})
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_post_delete(sender, instance, origin=None, **kwargs):
+    # Archived rows stay in the ledger and the balances
+    if _deleting_account(origin) or archiving.get():
+        return
+    ledger.record_deleted(instance)
+    response_cache.bump_accounts([instance.account_id])
+
+
+@receiver(post_save, sender=InvestmentAccount)
+@receiver(post_delete, sender=InvestmentAccount)
+def investment_account_changed(sender, instance, **kwargs):
+    response_cache.bump_accounts([instance.pk], accounts=True)
+
+
+def _invalidate_permissions(user_id):
+    permission_cache.invalidate(user_id)
+    # Drop it again on commit in case another request cached the old rows in between
+    transaction.on_commit(lambda: permission_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=UserAccountPermission)
+@receiver(post_delete, sender=UserAccountPermission)
+def user_account_permission_changed(sender, instance, **kwargs):
+    # Bulk changes invalidate once for all their rows
+    if applying_permission_changes.get():
+        return
+    _invalidate_permissions(instance.user_id)
+    response_cache.bump_accounts([instance.account_id])
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    # Ids can be reused (SQLite after a rollback), so never let a new user inherit a cached map
+    if created:
+        permission_cache.invalidate(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Hot transactions cascade and are reversed one by one; archived rows have no FK, so reverse them here
+    archived = ArchivedTransaction.objects.filter(user_id=instance.pk)
+    events = [event for row in archived.only('id', 'account_id', 'user_id', 'amount', 'created_at').iterator()
+              for event in ledger.deleted_events(row)]
+    if not events:
+        return
+    ledger.append(events)
+    archived.delete()
+    response_cache.bump_accounts({event.account_id for event in events})
@@ -0,0 +1,191 @@
+"""
+Vectorized account statistics over the full transaction history (hot and archived).
+
+An account's (created_at, amount, user) columns are fetched once, as epoch
+seconds and integer cents computed by the database, straight from the cursor
+in chunks so no per-row model fields or converters run and only one chunk of
+rows is held as Python tuples. Everything else is NumPy:
+amounts stay in int64 cents, so totals are exact. Results are cached per
+``(account, ledger_sequence)``; any write to the account moves its ledger
+sequence and so misses the cache.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import chain
+from django.conf import settings
+from django.db import NotSupportedError, connections
+from django.db.models import BigIntegerField, F, FloatField, Func
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+from .encoders import format_datetime
+from .models import ArchivedTransaction, InvestmentAccount, Transaction
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_CACHE_SIZE = 32
+# Rows converted per fetchmany() call
+FETCH_SIZE = 10000
+
+_statistics_cache = None
+
+
+class EpochSeconds(Func):
+    """Seconds since 1970-01-01 UTC of a datetime column, as a float."""
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"EpochSeconds is not implemented for {connection.vendor}.")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template="((julianday(%(expressions)s) - 2440587.5) * 86400.0)",
+                              **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)::double precision",
+                              **extra_context)
+
+
+def fetch_columns(queryset, chunk_size=FETCH_SIZE):
+    """Return the ``(seconds, cents, user_ids)`` arrays of ``queryset``, ordered by (created_at, id)."""
+    # All expressions, since values_list() would put a plain field name first in the SELECT
+    columns = queryset.order_by('created_at', 'id').values_list(
+        EpochSeconds('created_at'), Cast(Round(F('amount') * 100), BigIntegerField()), F('user_id'))
+    # Run on the cursor directly, skipping the per-row converters of the ORM. A server-side
+    # cursor where there is one, and ``chunk_size`` rows at a time into NumPy, so only one
+    # chunk of Python tuples is alive at once
+    sql, params = columns.query.get_compiler(columns.db).as_sql()
+    chunks = []
+    with connections[columns.db].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=3 * len(rows)))
+    table = (np.concatenate(chunks) if chunks else np.empty(0)).reshape(-1, 3)
+    return table[:, 0], np.rint(table[:, 1]).astype(np.int64), table[:, 2].astype(np.int64)
+
+
+def load_history(account_id):
+    """Columns of the account's hot and archived transactions, merged in time order."""
+    seconds, cents, users = fetch_columns(Transaction.objects.filter(account_id=account_id))
+    archived = fetch_columns(ArchivedTransaction.objects.filter(account_id=account_id))
+    if len(archived[0]):
+        order = np.argsort(np.concatenate([archived[0], seconds]), kind='stable')
+        seconds, cents, users = (np.concatenate(pair)[order] for pair in zip(archived, (seconds, cents, users)))
+    return seconds, cents, users
+
+
+def format_cents(value):
+    """Format integer cents as DRF renders a two-place DecimalField."""
+    value = int(value)
+    sign = '-' if value < 0 else ''
+    return f"{sign}{abs(value) // 100}.{abs(value) % 100:02d}"
+
+
+def day_starts(first, last, tz):
+    """Epoch seconds of each local midnight from the day of ``first`` to the day after ``last``."""
+    day = datetime.fromtimestamp(first, tz).date()
+    end = datetime.fromtimestamp(last, tz).date() + timedelta(days=1)
+    days = []
+    while day <= end:
+        days.append(day)
+        day += timedelta(days=1)
+    # Per day rather than a fixed 86400 s step, so DST changes land on the right midnight
+    starts = np.array([datetime.combine(d, datetime.min.time(), tz).timestamp() for d in days])
+    return days[:-1], starts
+
+
+def compute(seconds, cents, users, tz):
+    """All statistics of one account's history; see account_statistics()."""
+    if not len(seconds):
+        return {'transactions': 0, 'dates': [], 'balance': [], 'inflow': [], 'outflow': [], 'net_flow': [],
+                'time_weighted_balance': [], 'max_drawdown': None, 'users': []}
+
+    days, starts = day_starts(seconds[0], seconds[-1], tz)
+    day_index = np.searchsorted(starts, seconds, side='right') - 1
+    count = len(days)
+
+    inflow = np.bincount(day_index, weights=np.where(cents > 0, cents, 0), minlength=count)
+    outflow = np.bincount(day_index, weights=np.where(cents < 0, -cents, 0), minlength=count)
+    net = np.rint(inflow - outflow).astype(np.int64)
+    closing = np.cumsum(net)
+    opening = closing - net
+    # A flow counts toward a day's average balance for the share of the day left after it
+    remaining = (starts[day_index + 1] - seconds) / (starts[day_index + 1] - starts[day_index])
+    time_weighted = opening + np.bincount(day_index, weights=cents * remaining, minlength=count)
+
+    # Balance after each transaction, with the zero balance before the first one
+    curve = np.concatenate([[0], np.cumsum(cents)])
+    drawdown = np.maximum.accumulate(curve) - curve
+    trough = int(np.argmax(drawdown))
+    max_drawdown = None
+    if drawdown[trough] > 0:
+        peak = int(np.argmax(curve[:trough + 1]))
+        max_drawdown = {
+            'amount': format_cents(drawdown[trough]),
+            'peak_balance': format_cents(curve[peak]),
+            'trough_balance': format_cents(curve[trough]),
+            # Index 0 of the curve is the opening zero, before any transaction
+            'peak_at': format_datetime(datetime.fromtimestamp(seconds[peak - 1], tz), tz) if peak else None,
+            'trough_at': format_datetime(datetime.fromtimestamp(seconds[trough - 1], tz), tz),
+        }
+
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    user_totals = np.bincount(user_index, weights=cents)
+    user_counts = np.bincount(user_index)
+    # Share of the account's gross flow (inflows plus outflows)
+    user_gross = np.bincount(user_index, weights=np.abs(cents))
+    gross = user_gross.sum()
+
+    return {
+        'transactions': int(len(seconds)),
+        'dates': [day.isoformat() for day in days],
+        'balance': [format_cents(value) for value in closing],
+        'inflow': [format_cents(value) for value in np.rint(inflow)],
+        'outflow': [format_cents(value) for value in np.rint(outflow)],
+        'net_flow': [format_cents(value) for value in net],
+        'time_weighted_balance': [format_cents(value) for value in np.rint(time_weighted)],
+        'max_drawdown': max_drawdown,
+        'users': [
+            {
+                'user': int(user_id),
+                'total': format_cents(np.rint(total)),
+                'count': int(user_count),
+                'share': round(float(flow / gross), 6) if gross else 0.0,
+            }
+            for user_id, total, user_count, flow in zip(user_ids, user_totals, user_counts, user_gross)
+        ],
+    }
+
+
+def _statistics(account_id, sequence, tz):
+    return compute(*load_history(account_id), tz)
+
+
+def statistics_cache():
+    """LRU of computed statistics, built on first use and again when ACCOUNT_STATS_CACHE_SIZE changes."""
+    global _statistics_cache
+    maxsize = getattr(settings, 'ACCOUNT_STATS_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    if _statistics_cache is None or _statistics_cache.cache_info().maxsize != maxsize:
+        _statistics_cache = lru_cache(maxsize=maxsize)(_statistics)
+    return _statistics_cache
+
+
+def account_statistics(account_id):
+    """
+    Statistics of the account's whole history, as day-by-day columns plus summaries.
+
+    ``dates`` lists every calendar day (current time zone) from the first
+    transaction to the last, and ``balance``, ``inflow``, ``outflow``,
+    ``net_flow`` and ``time_weighted_balance`` (the balance averaged over the
+    time within the day it was held) have one entry per date. ``max_drawdown``
+    is the largest fall of the balance from a running peak, between
+    transactions; ``users`` has each user's net contribution. Amounts are
+    decimal strings like the rest of the API.
+    """
+    if np is None:
+        raise ImportError("Account statistics need NumPy (pip install numpy).")
+    sequence = InvestmentAccount.objects.filter(pk=account_id).values_list('ledger_sequence', flat=True).first()
+    result = statistics_cache()(account_id, sequence, timezone.get_current_timezone())
+    return {'account': account_id, 'ledger_sequence': sequence, **result}
@@ -0,0 +1,65 @@
+"""Handlers for the job kinds in api.jobs.HANDLERS."""
+import os
+from django.db import transaction
+from . import jobs, ledger
+from .balances import rebuild_balances as reconcile_balances, rebuild_daily_balances as reconcile_daily_balances
+from .export import stream_transactions
+from .reports import filter_archived, filter_transactions
+from .response_cache import bump_accounts, bump_all
+
+REPORT_FORMATS = ('csv', 'ndjson')
+
+
+def report(job):
+    """
+    Write an account's transactions, filtered like admin_transactions, to a gzipped CSV or NDJSON file.
+
+    Params: ``account``, ``format`` and optionally ``user_id``, ``start_date`` and ``end_date``.
+    """
+    params = job.params
+    account_id = params['account']
+    export_format = params.get('format', 'csv')
+    transactions, date_range = filter_transactions(params, account_id)
+    archived = filter_archived(params, account_id, date_range)
+
+    directory = jobs.result_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    job.result_file = f'job-{job.pk}-account-{account_id}.{export_format}.gz'
+    path = directory / job.result_file
+    partial = path.with_name(path.name + '.partial')
+    try:
+        with open(partial, 'wb') as output:
+            for block in stream_transactions(transactions, export_format, compress=True, archived=archived):
+                output.write(block)
+        # Renamed into place once complete, so a download never sees half a file
+        os.replace(partial, path)
+    finally:
+        # Only still there when writing failed
+        partial.unlink(missing_ok=True)
+    return {'bytes': path.stat().st_size}
+
+
+def rebuild_balances(job):
+    accounts = job.params.get('accounts')
+    with transaction.atomic():
+        mismatches = reconcile_balances(accounts)
+    bump_accounts(account_id for account_id, _, _ in mismatches)
+    return {'fixed': len(mismatches)}
+
+
+def rebuild_daily_balances(job):
+    with transaction.atomic():
+        written = reconcile_daily_balances(job.params.get('accounts'))
+    bump_all()
+    return {'written': written}
+
+
+def rebuild_projections(job):
+    accounts = job.params.get('accounts')
+    names = job.params.get('projections') or list(ledger.PROJECTIONS)
+    replayed = {}
+    for name in names:
+        with transaction.atomic():
+            replayed[name] = ledger.rebuild(ledger.PROJECTIONS[name], accounts)
+    bump_all()
+    return {'replayed': replayed}
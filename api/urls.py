@@ -1,13 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import InvestmentAccountViewSet, TransactionViewSet
+from .views import InvestmentAccountViewSet, JobViewSet, TransactionViewSet, UserAccountPermissionViewSet
+from . import async_views, metrics
 
 
 router = DefaultRouter()
 router.register(r'investmentaccounts', InvestmentAccountViewSet, basename='investmentaccount')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'permissions', UserAccountPermissionViewSet, basename='useraccountpermission')
 
 urlpatterns = [
    
     path('', include(router.urls)),
+    # Async-native read endpoints, for ASGI servers
+    path('async/investmentaccounts/', async_views.account_list, name='async-investmentaccount-list'),
+    path('async/investmentaccounts/<int:pk>/', async_views.account_detail, name='async-investmentaccount-detail'),
+    path('async/investmentaccounts/<int:pk>/balance/', async_views.account_balance, name='async-investmentaccount-balance'),
+    path('async/transactions/', async_views.transaction_list, name='async-transaction-list'),
+    path('metrics/', metrics.metrics_view, name='metrics'),
 ]
@@ -0,0 +1,24 @@
+"""Version counters kept in a Django cache, shared by the permission and response caches."""
+import time
+
+
+def get_versions(cache, keys):
+    """Return the current value of each counter in ``cache``, creating missing ones."""
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Seed from the clock so a counter lost to eviction never comes back with an old value
+        seed = time.time_ns()
+        for key in missing:
+            cache.add(key, seed, None)
+        found.update(cache.get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def bump_versions(cache, keys):
+    """Increment each counter in ``cache``; one that was evicted restarts from the clock."""
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
@@ -1,79 +1,443 @@
-from decimal import Decimal
-from rest_framework import viewsets, permissions
+from rest_framework import mixins, viewsets, permissions, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from django.contrib.auth.models import User
 from django.db.models import Sum
 from rest_framework.decorators import action
-from .models import InvestmentAccount, Transaction, UserAccountPermission
-from .serializers import InvestmentAccountSerializer, TransactionSerializer
+from .models import InvestmentAccount, Job, Transaction, UserAccountPermission
+from .serializers import (
+    JOB_PARAMS_SERIALIZERS, BulkTransactionSerializer, InvestmentAccountSerializer, JobSerializer,
+    PermissionChangeSerializer, ReportParamsSerializer, TransactionSerializer, UserAccountPermissionSerializer,
+)
 from .permissions import AccountPermission
-from django.utils.dateparse import parse_date
+from .pagination import KeysetPagination, PermissionPagination
+from .balances import account_balance, cents, range_total
+from .ledger import record_created, user_total
+from .parsers import NDJSONParser
+from .idempotency import idempotent
+from .log import PRESAMPLED, sampled
+from .permission_cache import get_account_permissions, listable_accounts
+from .response_cache import (
+    account_keys, account_list_keys, bump_accounts, cached_response, transaction_list_keys,
+)
+from .export import stream_transactions
+from . import grants, jobs, reports, stats
+from .write_queue import write_queue
+from .concurrency import OptimisticConcurrencyMixin
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .encoders import transaction_rows, transaction_values
+from .middleware import timed_serialization
+from .analytics import METRICS, PERIODS, ROLLUP_METRICS, aggregate_rollup, aggregate_transactions
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
-class InvestmentAccountViewSet(viewsets.ModelViewSet):
+
+
+def paginate_transactions(paginator, transactions, request, view, archived=None):
+    """
+    Return one page of ``transactions`` in TransactionSerializer's output format.
+
+    JSON responses skip the serializer: rows come from values_list() and are
+    formatted directly, which gives the same output without building model
+    instances or running the per-field machinery. ``archived`` rows, when
+    given, are merged into the page the same way.
+    """
+    if archived is not None:
+        page = paginator.paginate_querysets(
+            [transaction_values(transactions), transaction_values(archived)], request, view=view)
+    elif request.accepted_renderer.format == 'json':
+        page = paginator.paginate_queryset(transaction_values(transactions), request, view=view)
+    else:
+        page = paginator.paginate_queryset(transactions, request, view=view)
+        with timed_serialization(request):
+            return TransactionSerializer(page, many=True).data
+    with timed_serialization(request):
+        return transaction_rows(page)
+
+
+class InvestmentAccountViewSet(OptimisticConcurrencyMixin, viewsets.ModelViewSet):
     queryset = InvestmentAccount.objects.all()
     serializer_class = InvestmentAccountSerializer
     permission_classes = [AccountPermission]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    # Staff-only actions, which like admin_transactions and export reach every account
+    admin_actions = ('admin_transactions', 'analytics', 'statistics', 'export', 'report')
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_superuser:
+        if user.is_superuser or self.action in self.admin_actions:
             return InvestmentAccount.objects.all()
-        return InvestmentAccount.objects.filter(users=user)
+        return InvestmentAccount.objects.filter(listable_accounts(self.request, 'pk'))
+
+    @cached_response(account_list_keys)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def filter_transactions(self, request, account_id, model=Transaction):
+        """Apply the user_id/start_date/end_date query filters, see reports.filter_transactions()."""
+        return reports.filter_transactions(request.query_params, account_id, model)
+
+    def filter_archived(self, request, account_id, date_range):
+        return reports.filter_archived(request.query_params, account_id, date_range)
 
     @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    @cached_response(account_keys)
     def admin_transactions(self, request, pk=None):
-        user_id = request.query_params.get('user_id')  
         account_id = pk  
+        transactions, date_range = self.filter_transactions(request, account_id)
+        archived = self.filter_archived(request, account_id, date_range)
 
-        # Filter transactions based on user_id and account_id
-        transactions = Transaction.objects.filter(account_id=account_id)
-        
-        if user_id:
-            transactions = transactions.filter(user_id=user_id)
-        
-        # Filter transactions by date range if provided
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        user_id = request.query_params.get('user_id')
+        if user_id and not date_range:
+            # Read from the per-user ledger projection, which only applies the events since it was last read
+            total_balance = user_total(account_id, user_id)
+        elif user_id:
+            total_balance = cents(transactions.aggregate(Sum('amount'))['amount__sum'])
+            if archived is not None:
+                total_balance += cents(archived.aggregate(Sum('amount'))['amount__sum'])
+        elif date_range:
+            total_balance = range_total(account_id, *date_range)
+        else:
+            # The whole account was asked for, so the materialized balance is exact
+            total_balance = account_balance(account_id)
+
+        paginator = KeysetPagination()
+        page = paginate_transactions(paginator, transactions, request, self, archived)
+
+        return Response({
+            'transactions': page,
+            'total_balance': f"{total_balance:.2f}",
+            'next': paginator.get_next_link(),
+        })
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    @cached_response(account_keys)
+    def analytics(self, request, pk=None):
+        """
+        Aggregate the account's transactions per day, week or month.
 
-        if start_date and end_date:
-            start_date = parse_date(start_date)
-            end_date = parse_date(end_date)
-            if start_date and end_date:
-            
-                start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
-                end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
-                transactions = transactions.filter(created_at__range=[start_datetime, end_datetime])
+        Query parameters: ``period`` (day/week/month, default month),
+        ``metrics`` (comma separated from total/count/min/max, default all),
+        ``group_by=user`` for a per-user breakdown, and the user_id/start_date/
+        end_date filters of admin_transactions. Totals and counts of the whole
+        account are read from the daily rollup.
+        """
+        period = request.query_params.get('period', 'month')
+        if period not in PERIODS:
+            raise ValidationError({'period': [f'Must be one of: {", ".join(PERIODS)}.']})
+        metrics = request.query_params.get('metrics')
+        metrics = tuple(metric.strip() for metric in metrics.split(',')) if metrics else METRICS
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValidationError({'metrics': [f'Unknown metric(s): {", ".join(sorted(unknown))}.']})
+        group_by = request.query_params.get('group_by')
+        if group_by not in (None, 'user'):
+            raise ValidationError({'group_by': ['Only "user" is supported.']})
 
-        total_balance = transactions.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
+        account = self.get_object()
+        transactions, date_range = self.filter_transactions(request, account.pk)
+        if set(metrics) <= set(ROLLUP_METRICS) and not group_by and not request.query_params.get('user_id'):
+            results = aggregate_rollup(account.pk, period, metrics, date_range)
+        else:
+            archived = self.filter_archived(request, account.pk, date_range)
+            results = aggregate_transactions(transactions, period, metrics, by_user=group_by == 'user', archived=archived)
 
         return Response({
-            'transactions': TransactionSerializer(transactions, many=True).data,
-            'total_balance': f"{total_balance:.2f}"
+            'account': account.pk,
+            'period': period,
+            'group_by': group_by,
+            'results': results,
         })
 
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    @cached_response(account_keys)
+    def statistics(self, request, pk=None):
+        """
+        Balance curve, daily flows, time-weighted balance, max drawdown and per-user contributions.
+
+        Computed with NumPy over the account's whole history, see api.stats.
+        """
+        if stats.np is None:
+            return Response({'detail': 'Account statistics need NumPy installed on the server.'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        account = self.get_object()
+        return Response(stats.account_statistics(account.pk))
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser],
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, pk=None):
+        """Stream the account's transactions as NDJSON or CSV, gzipped when the client accepts it."""
+        transactions, date_range = self.filter_transactions(request, pk)
+        archived = self.filter_archived(request, pk, date_range)
+        export_format = request.accepted_renderer.format
+        compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+        response = StreamingHttpResponse(
+            stream_transactions(transactions, export_format, compress=compress, archived=archived),
+            content_type=request.accepted_renderer.media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="account-{pk}-transactions.{export_format}"'
+        response['Vary'] = 'Accept, Accept-Encoding'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        return response
 
-class TransactionViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def report(self, request, pk=None):
+        """
+        Queue a report of the account's transactions for the background worker and answer 202.
+
+        Takes ``format`` (csv or ndjson) and the user_id/start_date/end_date
+        filters of export, as query parameters or in the body. The job's
+        result_url serves the gzipped file once run_worker has written it.
+        """
+        params = request.query_params.dict()
+        data = request.data.dict() if hasattr(request.data, 'dict') else request.data
+        if isinstance(data, dict):
+            params.update(data)
+        # Empty filters are the same as no filter
+        params = {name: value for name, value in params.items() if value not in ('', None)}
+
+        account = self.get_object()
+        serializer = ReportParamsSerializer(data={**params, 'account': account.pk})
+        serializer.is_valid(raise_exception=True)
+        job = jobs.enqueue('report', serializer.data, user=request.user)
+        return Response(
+            JobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': request.build_absolute_uri(reverse('job-detail', args=[job.pk]))},
+        )
+
+
+class TransactionViewSet(OptimisticConcurrencyMixin, viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [AccountPermission]
+    pagination_class = KeysetPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @cached_response(transaction_list_keys)
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_paginated_response(paginate_transactions(self.paginator, queryset, request, self))
 
     def perform_create(self, serializer):
         logger.debug("Perform create method called")
-        serializer.save(user=self.request.user)
+        if write_queue.enabled():
+            # SQLite performance mode: group-committed with other requests' writes on the writer thread
+            write_queue.run(serializer.save, user=self.request.user)
+            return
+        # The account balance is updated by a post_save signal, keep it in the same transaction
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    @idempotent
+    def bulk_create(self, request):
+        """
+        Create many transactions from a JSON array or NDJSON body.
+
+        Account permissions for every row are checked against a single lookup of
+        the caller's permission map. Valid rows are inserted with bulk_create in
+        batches of ``TRANSACTION_BULK_BATCH_SIZE``; invalid rows are reported by
+        their index and skipped.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({'detail': 'Expected a list of transactions.'})
+        max_rows = getattr(settings, 'TRANSACTION_BULK_MAX_ROWS', 100000)
+        if len(rows) > max_rows:
+            raise ValidationError({'detail': f'At most {max_rows} transactions can be posted at once.'})
+
+        account_permissions = get_account_permissions(request)
+        allowed = [UserAccountPermission.POST_ONLY, UserAccountPermission.CRUD]
+        row_serializer = BulkTransactionSerializer()
+        transactions = []
+        errors = []
+        now = timezone.now()
+        for index, row in enumerate(rows):
+            try:
+                data = row_serializer.run_validation(row)
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+                continue
+            if account_permissions.get(data['account']) not in allowed:
+                errors.append({'index': index, 'errors': {'account': ['You do not have permission to post to this account.']}})
+                continue
+            transactions.append(Transaction(account_id=data['account'], user=request.user, amount=data['amount'], created_at=now))
+
+        batch_size = getattr(settings, 'TRANSACTION_BULK_BATCH_SIZE', 1000)
+        with transaction.atomic():
+            Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+            record_created(transactions, batch_size=batch_size)
+            # bulk_create sends no signals, so cached reads of these accounts are dropped here
+            bump_accounts({t.account_id for t in transactions})
+        logger.info(
+            "Bulk created %d transactions, rejected %d", len(transactions), len(errors),
+            extra={'user_id': request.user.pk, 'created_count': len(transactions), 'rejected_count': len(errors)},
+        )
+
+        return Response({
+            'created': len(transactions),
+            'ids': [t.pk for t in transactions],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED if transactions or not errors else status.HTTP_400_BAD_REQUEST)
 
     def get_queryset(self):
         user = self.request.user
-        logger.debug(f"Getting queryset for user: {user}")
-        
-        # Get all accounts the user has permissions for
-        user_account_permissions = UserAccountPermission.objects.filter(user=user)
-        allowed_account_ids = user_account_permissions.values_list('account_id', flat=True)
+        logger.debug("Getting queryset for user: %s", user)
         
-        # Filter transactions based on these accounts
-        queryset = Transaction.objects.filter(account_id__in=allowed_account_ids)
+        # Only accounts the user can view (VIEW_ONLY or CRUD), from the cached per-user set
+        queryset = Transaction.objects.filter(listable_accounts(self.request))
         
-        logger.debug(f"Queryset count: {queryset.count()}")
+        # Counting costs as much as the list query itself, only do it when someone will see it
+        if sampled(logger, logging.DEBUG):
+            logger.debug("Queryset count: %d", queryset.count(), extra={'user_id': user.pk, PRESAMPLED: True})
         return queryset
+
+
+class JobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs of the requesting user (all jobs for superusers).
+
+    Staff can queue balance and projection rebuilds with a POST of ``kind``
+    and ``params``; reports are queued by InvestmentAccountViewSet.report.
+    """
+    serializer_class = JobSerializer
+    pagination_class = KeysetPagination
+
+    def get_permissions(self):
+        if self.action == 'create':
+            return [permissions.IsAdminUser()]
+        return [permissions.IsAuthenticated()]
+
+    def get_queryset(self):
+        if self.request.user.is_superuser:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        kind = request.data.get('kind')
+        if kind not in jobs.ADMIN_KINDS:
+            raise ValidationError({'kind': [f'Must be one of: {", ".join(jobs.ADMIN_KINDS)}.']})
+        params = request.data.get('params') or {}
+        if not isinstance(params, dict):
+            raise ValidationError({'params': ['Expected an object.']})
+        serializer = JOB_PARAMS_SERIALIZERS[kind](data=params)
+        if not serializer.is_valid():
+            raise ValidationError({'params': serializer.errors})
+        job = jobs.enqueue(kind, serializer.data, user=request.user)
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': request.build_absolute_uri(reverse('job-detail', args=[job.pk]))},
+        )
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        """Download the file a finished job wrote."""
+        job = self.get_object()
+        path = jobs.result_path(job)
+        if job.status != Job.DONE or path is None or not path.exists():
+            raise NotFound('This job has no result file.')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.result_file,
+                            content_type='application/gzip')
+
+
+class UserAccountPermissionViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    The user/account permission matrix, for staff.
+
+    The list is paged by (user, account) and can be narrowed with
+    ``?user=<id>`` and ``?account=<id>``; changes are made in bulk through
+    the ``bulk`` action.
+    """
+    serializer_class = UserAccountPermissionSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = PermissionPagination
+
+    def get_queryset(self):
+        queryset = UserAccountPermission.objects.all()
+        for field in ('user', 'account'):
+            value = self.request.query_params.get(field)
+            if value is None:
+                continue
+            if not value.isdigit():
+                raise ValidationError({field: ['Expected an id.']})
+            queryset = queryset.filter(**{f'{field}_id': int(value)})
+        return queryset
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Grant, change or revoke permissions from a JSON array or NDJSON body.
+
+        Each row is ``{"user": id, "account": id, "permission": "view" | "crud"
+        | "post" | null}``; existing rows are updated, a null permission deletes
+        the row. When a pair appears more than once the last row wins. The
+        change is all or nothing: any invalid row is reported by its index and
+        nothing is written. Rows are written in batches of
+        ``PERMISSION_BULK_BATCH_SIZE`` inside one transaction.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({'detail': 'Expected a list of permission changes.'})
+        max_rows = getattr(settings, 'PERMISSION_BULK_MAX_ROWS', 100000)
+        if len(rows) > max_rows:
+            raise ValidationError({'detail': f'At most {max_rows} permission changes can be posted at once.'})
+
+        row_serializer = PermissionChangeSerializer()
+        changes = {}
+        indexes = {}
+        errors = []
+        for index, row in enumerate(rows):
+            try:
+                data = row_serializer.run_validation(row)
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+                continue
+            pair = (data['user'], data['account'])
+            changes[pair] = data['permission']
+            indexes[pair] = index
+
+        # Revoking a pair that does not exist is a no-op, so only granted ids have to exist
+        batch_size = getattr(settings, 'PERMISSION_BULK_BATCH_SIZE', grants.DEFAULT_BATCH_SIZE)
+        granted = {pair: permission for pair, permission in changes.items() if permission is not None}
+        users = grants.existing_ids(User, {user_id for user_id, _ in granted}, batch_size)
+        accounts = grants.existing_ids(InvestmentAccount, {account_id for _, account_id in granted}, batch_size)
+        for user_id, account_id in granted:
+            missing = {}
+            if user_id not in users:
+                missing['user'] = [f'User {user_id} does not exist.']
+            if account_id not in accounts:
+                missing['account'] = [f'Account {account_id} does not exist.']
+            if missing:
+                errors.append({'index': indexes[user_id, account_id], 'errors': missing})
+        if errors:
+            return Response({'errors': sorted(errors, key=lambda error: error['index'])},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        revoked = [pair for pair, permission in changes.items() if permission is None]
+        deleted = grants.apply_changes(granted, revoked, batch_size=batch_size)
+        logger.info(
+            "Bulk permission change: %d granted, %d revoked", len(granted), deleted,
+            extra={'user_id': request.user.pk, 'granted_count': len(granted), 'revoked_count': deleted},
+        )
+        return Response({
+            'granted': len(granted),
+            'revoked': deleted,
+            'users': len({user_id for user_id, _ in changes}),
+            'accounts': len({account_id for _, account_id in changes}),
+        })
@@ -0,0 +1,136 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_WAIT = 0.002
+DEFAULT_TIMEOUT = 30
+
+
+class WriteTimeout(APIException):
+    """
+    The write did not finish within ``SQLITE_WRITE_QUEUE_TIMEOUT``.
+
+    A write still waiting in the queue is cancelled and reported as not
+    applied; one the writer had already started may yet commit.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The write did not finish in time and may still have been applied. Check before retrying.'
+    default_code = 'write_timeout'
+
+
+class WriteQueue:
+    """
+    Single writer thread that group-commits writes submitted by request threads.
+
+    SQLite allows one writer at a time, so request threads that each open a
+    write transaction mostly wait on the lock and time out under load. Here
+    they hand their write to one thread instead, which collects whatever
+    arrives within ``SQLITE_WRITE_QUEUE_MAX_WAIT`` seconds (at most
+    ``SQLITE_WRITE_QUEUE_BATCH_SIZE`` writes) and commits them together. Each
+    write runs in its own savepoint, so a failing one is rolled back alone and
+    its exception re-raised in the submitting thread. A caller that gives up
+    after ``SQLITE_WRITE_QUEUE_TIMEOUT`` seconds gets WriteTimeout (503).
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'SQLITE_WRITE_QUEUE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    @property
+    def max_wait(self):
+        return getattr(settings, 'SQLITE_WRITE_QUEUE_MAX_WAIT', DEFAULT_MAX_WAIT)
+
+    def enabled(self):
+        """True when writes should go through the queue rather than the caller's connection."""
+        connection = connections[self.using]
+        return (
+            getattr(settings, 'SQLITE_WRITE_QUEUE', False)
+            and connection.vendor == 'sqlite'
+            # Writes inside the caller's transaction have to stay in it
+            and not connection.in_atomic_block
+        )
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._start()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Run ``func`` on the writer thread and return its result once committed."""
+        timeout = getattr(settings, 'SQLITE_WRITE_QUEUE_TIMEOUT', DEFAULT_TIMEOUT)
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # Only succeeds while the writer has not picked it up, which then skips it
+            if future.cancel():
+                raise WriteTimeout('The write queue is busy and the write was not applied. Retry the request.',
+                                   code='write_not_applied')
+            raise WriteTimeout()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception:
+                logger.exception("Write queue batch failed")
+
+    def _commit(self, batch):
+        connection = connections[self.using]
+        connection.close_if_unusable_or_obsolete()
+        outcomes = []
+        try:
+            with transaction.atomic(using=self.using):
+                for future, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=self.using):
+                            outcomes.append((future, func(*args, **kwargs), None))
+                    except Exception as exc:
+                        outcomes.append((future, None, exc))
+        except Exception as exc:
+            # The commit itself failed, so nothing in the batch was written
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        metrics.write_queue_batch_size.observe(len(outcomes))
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+write_queue = WriteQueue()